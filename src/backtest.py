@@ -0,0 +1,120 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+import polars as pl
+
+from equity import Products, simulate_equity_batch
+from income import IncomePercentile
+from market_data import load_all, month_index, msci_world_prices, vanguard_all_world_prices
+from real_estate import estimate_mortgage_payoff_years, simulate_real_estate_batch
+from scenario_results import ScenarioResults
+
+
+def feasible_start_months(years: int, product: Products) -> list[tuple[int, int]]:
+    """
+    every (year, month) whose full horizon is covered by price data
+    """
+    assert 0 < years
+    first_month, prices = {Products.MSCI_WORLD: msci_world_prices, Products.VANGUARD_ALL_WORLD: vanguard_all_world_prices}[product]()
+    last_month = min(first_month + len(prices) - 1, month_index(2024, 12))  # rent_adjusted only covers years before 2025
+
+    starts = [(index // 12, index % 12 + 1) for index in range(first_month, last_month - years * 12 + 2)]
+    assert all(first_month <= month_index(year, month) for year, month in starts)
+    assert all(month_index(year, month) + years * 12 - 1 <= last_month for year, month in starts)
+    return starts
+
+
+def _run_windows(
+    starts: list[tuple[int, int]],
+    monthly_savings: float,
+    years: int,
+    purchase_price: float,
+    cash_savings: float,
+    product: Products,
+    keep_paths: bool,
+) -> ScenarioResults:
+    # all windows of a chunk at once on the vectorized engines, same results as the scalar ones
+    assert len(starts) > 0
+    start_year, start_month = np.array(starts).T
+    months = years * 12
+    equity = simulate_equity_batch(monthly_savings, start_year, start_month, months, cash_savings, product)
+    real_estate = simulate_real_estate_batch(monthly_savings, start_year, start_month, months, purchase_price, cash_savings)
+    assert equity.shape == real_estate.shape == (len(starts), months)
+
+    results = ScenarioResults(months, keep_paths=keep_paths, strategies=("equity", "real_estate"))
+    results.add({"equity": equity, "real_estate": real_estate}, start_year=start_year, start_month=start_month)
+    return results
+
+
+def run_backtest(
+    monthly_savings: float,
+    years: int,
+    purchase_price: float,
+    cash_savings: float,
+    product: Products = Products.MSCI_WORLD,
+    max_workers: int | None = None,
+    keep_paths: bool = False,
+) -> pl.DataFrame:
+    """
+    run both strategies for every feasible start month, one row per window with the terminal wealth of each
+
+    `keep_paths` adds the monthly payouts of each window as array columns `equity_path` and `real_estate_path`.
+    """
+    assert monthly_savings > 0
+    assert years > 0
+    assert max_workers is None or max_workers > 0
+
+    starts = feasible_start_months(years, product)
+    assert len(starts) > 0, f"no {years} year window fits the price data"
+
+    # parse the data once, forked workers then share the arrays copy-on-write instead of re-reading them
+    load_all()
+    max_workers = max_workers or os.cpu_count() or 1
+    chunk_size = -(-len(starts) // max_workers)  # windows are vectorized, one chunk per worker
+    chunks = [starts[i : i + chunk_size] for i in range(0, len(starts), chunk_size)]
+    run_chunk = partial(_run_windows, monthly_savings=monthly_savings, years=years, purchase_price=purchase_price, cash_savings=cash_savings, product=product, keep_paths=keep_paths)
+
+    results = ScenarioResults(years * 12, keep_paths=keep_paths, strategies=("equity", "real_estate"))
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("fork")) as executor:
+        for chunk in executor.map(run_chunk, chunks):
+            results.extend(chunk)
+
+    paths = [f"{strategy}_path" for strategy in results.strategies] if keep_paths else []
+    df = results.to_polars().select(pl.date("start_year", "start_month", 1).alias("start_date"), "equity", "real_estate", (pl.col("equity") - pl.col("real_estate")).alias("spread"), *paths)
+    assert df.height == len(starts)
+    return df
+
+
+def backtest_summary(df: pl.DataFrame) -> pl.DataFrame:
+    """
+    win rates and spread distribution over all windows
+    """
+    assert df.height > 0
+    assert {"equity", "real_estate", "spread"} <= set(df.columns)
+
+    summary = df.select(
+        pl.len().alias("windows"),
+        (pl.col("spread") > 0).mean().alias("equity_win_rate"),
+        (pl.col("spread") < 0).mean().alias("real_estate_win_rate"),
+        pl.col("spread").min().alias("spread_min"),
+        pl.col("spread").quantile(0.05).alias("spread_p5"),
+        pl.col("spread").median().alias("spread_median"),
+        pl.col("spread").quantile(0.95).alias("spread_p95"),
+        pl.col("spread").max().alias("spread_max"),
+    )
+    assert summary.height == 1
+    return summary
+
+
+if __name__ == "__main__":
+    INITIAL_LUMP_SUM = 130_000
+    PROPERTY_PRICE = 500_000
+    INCOME = IncomePercentile.pct_75th.value / 12
+    YEARS = int(estimate_mortgage_payoff_years(INCOME, INITIAL_LUMP_SUM, PROPERTY_PRICE)) + 10
+
+    df = run_backtest(monthly_savings=INCOME, years=YEARS, purchase_price=PROPERTY_PRICE, cash_savings=INITIAL_LUMP_SUM)
+    print(df)
+    print(backtest_summary(df))
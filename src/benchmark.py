@@ -0,0 +1,148 @@
+"""
+benchmarks for the simulation hot paths
+
+reports the best wall time over several runs and the peak python heap (tracemalloc: numpy buffers are traced, polars' native buffers are not).
+results are compared against a json baseline, runs slower than the threshold are flagged as regressions.
+benchmarks/baseline.json holds the numbers of the tree before the performance work (7805911), benchmarks/after.json those after it.
+this file runs unchanged on both, to measure another tree copy it into that tree's src and pass `--save --baseline <file>`.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+from equity import Products, _prices_msci, _prices_vanguard, simulate_equity_portfolio
+from income import IncomePercentile, rent_adjusted
+from real_estate import _simulate_payoff_years, estimate_mortgage_payoff_years, simulate_real_estate_portfolio
+
+try:
+    from market_data import load_all
+except ImportError:  # trees before the market data store parse the csvs on every call
+    load_all = lambda: None
+
+BASELINE_PATH = Path(__file__).parent.parent / "benchmarks" / "baseline.json"
+
+# before the payoff cache, `_simulate_payoff_years` is a plain function
+_simulate_payoff_years_uncached = getattr(_simulate_payoff_years, "__wrapped__", _simulate_payoff_years)
+_clear_payoff_cache = getattr(_simulate_payoff_years, "cache_clear", lambda: None)
+HORIZONS = (10, 25, 37)  # 37: longest window covered by both the msci prices and the rent data
+
+
+def _cases() -> dict:
+    INCOME = IncomePercentile.pct_75th.value / 12
+    LUMP_SUM = 130_000
+    PRICE = 500_000
+    START_YEAR = 1988
+
+    def run_comparison():
+        import main
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            main.run_comparison()
+
+    def cold_start():
+        # fresh interpreter, so this includes imports and csv parsing
+        subprocess.run([sys.executable, "-c", "import main; main.run_comparison()"], cwd=Path(__file__).parent, stdout=subprocess.DEVNULL, check=True)
+
+    cases = {
+        "_simulate_payoff_years": lambda: _simulate_payoff_years_uncached(400_000.0, 0.034, INCOME),
+        "estimate_mortgage_payoff_years": lambda: estimate_mortgage_payoff_years(INCOME, LUMP_SUM, PRICE),
+        "main.run_comparison": run_comparison,
+        "main.run_comparison (cold start)": cold_start,
+    }
+    for years in HORIZONS:
+        cases[f"rent_adjusted[{years}y]"] = lambda years=years: [rent_adjusted(START_YEAR + month // 12) for month in range(years * 12)]
+        cases[f"_prices_msci[{years}y]"] = lambda years=years: _prices_msci(years * 12, 1, START_YEAR)
+        cases[f"simulate_equity_portfolio[{years}y]"] = lambda years=years: simulate_equity_portfolio(INCOME, years, START_YEAR, cash_savings=LUMP_SUM, product=Products.MSCI_WORLD)
+        cases[f"simulate_real_estate_portfolio[{years}y]"] = lambda years=years: simulate_real_estate_portfolio(INCOME, years, START_YEAR, PRICE, LUMP_SUM)
+    for years in sorted({min(years, 20) for years in HORIZONS}):  # only 20 years of vanguard data
+        cases[f"_prices_vanguard[{years}y]"] = lambda years=years: _prices_vanguard(years * 12, 1, 2004)
+    return cases
+
+
+def _measure(case, repeat: int) -> dict[str, float]:
+    assert repeat > 0
+    _clear_payoff_cache()
+    case()  # warm-up
+
+    seconds = []
+    for _ in range(repeat):
+        _clear_payoff_cache()
+        start = time.perf_counter()
+        case()
+        seconds.append(time.perf_counter() - start)
+
+    _clear_payoff_cache()
+    tracemalloc.start()
+    case()
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    assert len(seconds) == repeat
+    assert peak_bytes >= 0
+    return {"seconds": min(seconds), "peak_bytes": peak_bytes}
+
+
+def run_benchmarks(repeat: int = 5, only: str = "") -> dict[str, dict[str, float]]:
+    """
+    measure every case whose name contains `only`
+    """
+    assert repeat > 0
+    load_all()
+
+    # measure the computation, not the disk cache. the cold start subprocess inherits the flag
+    previous = os.environ.get("RENT_OR_BUY_CACHE")
+    os.environ["RENT_OR_BUY_CACHE"] = "off"
+    try:
+        results = {name: _measure(case, repeat) for name, case in _cases().items() if only in name}
+    finally:
+        if previous is None:
+            del os.environ["RENT_OR_BUY_CACHE"]
+        else:
+            os.environ["RENT_OR_BUY_CACHE"] = previous
+    assert results, f"no benchmark matches {only!r}"
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """
+    names of the cases that got slower than `threshold` relative to the baseline
+    """
+    assert threshold >= 0
+    regressions = [name for name, result in results.items() if name in baseline and result["seconds"] > baseline[name]["seconds"] * (1 + threshold)]
+    assert set(regressions) <= set(results)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", default="", help="only run cases whose name contains this")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--threshold", type=float, default=0.20, help="relative slowdown that counts as regression")
+    parser.add_argument("--save", action="store_true", help="store the results as new baseline")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.repeat, args.only)
+    baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    regressions = compare(results, baseline, args.threshold)
+
+    print(f"{'case':<45} {'time':>10} {'baseline':>10} {'peak mem':>10}")
+    for name, result in results.items():
+        reference = f"{baseline[name]['seconds'] * 1e3:8.2f}ms" if name in baseline else "-"
+        flag = "  REGRESSION" if name in regressions else ""
+        print(f"{name:<45} {result['seconds'] * 1e3:8.2f}ms {reference:>10} {result['peak_bytes'] / 1024**2:8.2f}MB{flag}")
+
+    if args.save:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(baseline | results, indent=2) + "\n")
+        print(f"saved baseline to {args.baseline}")
+
+    sys.exit(1 if regressions else 0)
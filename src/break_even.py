@@ -0,0 +1,98 @@
+import math
+from functools import cache
+from typing import NamedTuple
+
+import numpy as np
+
+from equity import Products, simulate_equity_portfolio
+from income import IncomePercentile
+from real_estate import simulate_real_estate_portfolio
+
+
+class BreakEven(NamedTuple):
+    """
+    final bracket around the point where buying matches renting
+
+    `gap` is real estate minus equity terminal wealth. if the gaps at both ends differ by far more than the bracket is wide,
+    the sign flips across a step (interest rate tier, commission bracket) rather than through a smooth root.
+    """
+
+    variable: str
+    low: float
+    high: float
+    gap_low: float
+    gap_high: float
+    evaluations: int
+
+
+@cache
+def _terminal_gap(monthly_savings: float, cash_savings: float, purchase_price: float, years: int, start_year: int, product: Products) -> float:
+    assert years > 0
+    assert purchase_price > 0
+    assert cash_savings >= 0
+
+    # scenarios the model rejects (e.g. insufficient down payment) have no gap
+    try:
+        real_estate = simulate_real_estate_portfolio(monthly_savings=monthly_savings, years=years, start_year=start_year, purchase_price=purchase_price, cash_savings=cash_savings)["payout"][-1]
+        equity = simulate_equity_portfolio(monthly_savings=monthly_savings, years=years, start_year=start_year, cash_savings=cash_savings, product=product)["payout"][-1]
+    except AssertionError:
+        return math.nan
+    return real_estate - equity
+
+
+def solve_break_even(
+    variable: str,
+    low: float,
+    high: float,
+    monthly_savings: float,
+    cash_savings: float,
+    purchase_price: float,
+    years: int,
+    start_year: int,
+    product: Products = Products.MSCI_WORLD,
+    tolerance: float = 1.0,
+    scan_points: int = 16,
+) -> BreakEven:
+    """
+    find the `variable` value in [low, high] where both strategies end with the same wealth, all other inputs fixed
+
+    `variable` is one of "purchase_price", "cash_savings" or "monthly_savings".
+    a coarse scan brackets the first sign change, bisection then narrows it down to `tolerance`.
+    bisection only needs a sign change, so it also converges onto the step discontinuities of the model.
+    """
+    assert variable in ("purchase_price", "cash_savings", "monthly_savings"), f"unknown variable {variable}"
+    assert low < high
+    assert tolerance > 0 and scan_points >= 2
+
+    inputs = {"monthly_savings": monthly_savings, "cash_savings": cash_savings, "purchase_price": purchase_price}
+    evaluations = 0
+
+    def gap(value: float) -> float:
+        nonlocal evaluations
+        evaluations += 1
+        return _terminal_gap(**(inputs | {variable: float(value)}), years=years, start_year=start_year, product=product)
+
+    # bracket
+    points = [(float(value), gap(value)) for value in np.linspace(low, high, scan_points)]
+    brackets = [(a, b) for a, b in zip(points, points[1:]) if not math.isnan(a[1]) and not math.isnan(b[1]) and a[1] * b[1] <= 0]
+    assert brackets, f"no break-even for {variable} in [{low}, {high}], gaps: {[round(g, 0) for _, g in points]}"
+    (low, gap_low), (high, gap_high) = brackets[0]
+
+    # bisect
+    while high - low > tolerance and gap_low != 0:
+        mid = (low + high) / 2
+        gap_mid = gap(mid)
+        assert not math.isnan(gap_mid), f"model rejects {variable}={mid} inside the bracket"
+        if gap_low * gap_mid <= 0:
+            high, gap_high = mid, gap_mid
+        else:
+            low, gap_low = mid, gap_mid
+
+    assert gap_low * gap_high <= 0
+    return BreakEven(variable=variable, low=low, high=high, gap_low=gap_low, gap_high=gap_high, evaluations=evaluations)
+
+
+if __name__ == "__main__":
+    INCOME = IncomePercentile.pct_75th.value / 12
+    print(solve_break_even("purchase_price", 250_000, 700_000, monthly_savings=INCOME, cash_savings=130_000, purchase_price=500_000, years=17, start_year=1994))
+    print(solve_break_even("cash_savings", 60_000, 400_000, monthly_savings=INCOME, cash_savings=130_000, purchase_price=500_000, years=17, start_year=1994))
@@ -0,0 +1,128 @@
+"""
+checkpointed, resumable batch runs
+
+every finished work unit is written to `<out_dir>/part-<unit>.parquet` and appended to `manifest.jsonl`, a rerun with the same inputs skips the units listed there.
+parts are renamed into place once complete, so `scan_results` can query a run while it is still going.
+only the units in flight are held in memory, regardless of the size of the run.
+"""
+
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections.abc import Callable, Iterable
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+import polars as pl
+
+from market_data import load_all
+from result_cache import content_hash, stable_repr
+
+
+def scan_results(out_dir: Path | str) -> pl.LazyFrame:
+    """
+    lazy frame over all finished parts of a run
+    """
+    assert any(Path(out_dir).glob("part-*.parquet")), f"no finished parts in {out_dir}"
+    return pl.scan_parquet(Path(out_dir) / "part-*.parquet")
+
+
+class Checkpoint:
+    """
+    parts and manifest of one run in `out_dir`
+
+    `fingerprint` identifies the run (all inputs that change results or unit boundaries), together with the market data and the model source, as for the disk cache.
+    any edit to `src` therefore starts a new run. resuming a directory that holds a different run is an error rather than a silent mix of results.
+    """
+
+    def __init__(self, out_dir: Path | str, fingerprint: dict):
+        self.out_dir = Path(out_dir)
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        self.manifest = self.out_dir / "manifest.jsonl"
+
+        key = f"{stable_repr(fingerprint)} {content_hash()}"
+        run = self.out_dir / "run.json"
+        if run.exists():
+            assert json.loads(run.read_text())["key"] == key, f"{out_dir} holds a different run (other inputs, data or model source), use a new directory"
+        else:
+            temporary = self.out_dir / ".run.json.tmp"
+            temporary.write_text(json.dumps({"key": key}))
+            os.replace(temporary, run)
+
+        # a run killed mid-append leaves a torn last line, that unit is simply redone
+        self.finished: set[int] = set()
+        if self.manifest.exists():
+            for line in self.manifest.read_text().splitlines():
+                try:
+                    unit = json.loads(line)["unit"]
+                except (ValueError, KeyError):
+                    continue
+                if self._part(unit).exists():
+                    self.finished.add(unit)
+
+    def _part(self, unit: int) -> Path:
+        return self.out_dir / f"part-{unit:06d}.parquet"
+
+    def write(self, unit: int, df: pl.DataFrame, seconds: float = 0.0) -> None:
+        # write, rename into place, then record. a part without a manifest entry is overwritten on resume
+        assert unit >= 0
+        temporary = self.out_dir / f".part-{unit:06d}.parquet.tmp"
+        df.write_parquet(temporary)
+        os.replace(temporary, self._part(unit))
+        with open(self.manifest, "a") as manifest:
+            manifest.write(json.dumps({"unit": unit, "rows": df.height, "seconds": round(seconds, 3)}) + "\n")
+            manifest.flush()
+            os.fsync(manifest.fileno())
+        self.finished.add(unit)
+
+    def scan(self) -> pl.LazyFrame:
+        return scan_results(self.out_dir)
+
+
+def _timed(evaluate: Callable, argument) -> tuple[pl.DataFrame, float]:
+    start = time.perf_counter()
+    df = evaluate(argument)
+    return df, time.perf_counter() - start
+
+
+def run_checkpointed(checkpoint: Checkpoint, evaluate: Callable, units: Iterable[tuple[int, object]], total: int, max_workers: int | None = None, progress: bool = True) -> pl.LazyFrame:
+    """
+    `evaluate(argument) -> pl.DataFrame` for every `(unit, argument)` not yet in the manifest, on worker processes
+
+    `units` is consumed lazily and at most two units per worker are in flight, so memory stays flat.
+    `evaluate` must be a module level function (or a partial of one), scripts calling this need an `if __name__ == "__main__":` guard.
+    """
+    assert total > 0
+    assert max_workers is None or max_workers > 0
+
+    # compile the data once, workers then only map the arrays
+    load_all()
+    max_workers = max_workers or os.cpu_count() or 1
+    pending = ((unit, argument) for unit, argument in units if unit not in checkpoint.finished)
+    resumed = len(checkpoint.finished)
+
+    # workers build polars frames, which deadlocks in children forked after a multi-threaded polars query in this process.
+    # forkserver children come from a clean server process that has the model imported once
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload(["market_data", getattr(evaluate, "func", evaluate).__module__])
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as executor:
+        in_flight = {}
+        while True:
+            while len(in_flight) < 2 * max_workers and (next_unit := next(pending, None)) is not None:
+                unit, argument = next_unit
+                in_flight[executor.submit(_timed, evaluate, argument)] = unit
+            if not in_flight:
+                break
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                df, seconds = future.result()
+                checkpoint.write(in_flight.pop(future), df, seconds)
+            if progress:
+                print(f"\r{checkpoint.out_dir.name}: {len(checkpoint.finished)}/{total} units ({resumed} resumed)", end="", file=sys.stderr, flush=True)
+    if progress:
+        print(file=sys.stderr)
+
+    assert len(checkpoint.finished) == total, f"{len(checkpoint.finished)} of {total} units finished"
+    return checkpoint.scan()
@@ -1,50 +1,52 @@
 import datetime
+from collections.abc import Callable, Iterator
 from enum import Enum
-from pathlib import Path
+from typing import NamedTuple
 
+import numpy as np
 import polars as pl
-from dateutil.relativedelta import relativedelta
 
-from income import rent_adjusted
+from income import rent_for_months
+from market_data import month_dates, month_index, msci_world_prices, oekb_msci_world, oekb_vanguard_all_world, vanguard_all_world_prices
+from result_cache import disk_cache
+
+
+def _slice_prices(first_month: int, all_prices: np.ndarray, months: int, start_month: int, start_year: int) -> list[float]:
+    assert months > 0
+    start = month_index(start_year, start_month)
+    offset = max(start - first_month, 0)
+    prices = all_prices[offset : offset + months].tolist()
+
+    month_date = lambda index: datetime.date(index // 12, index % 12 + 1, 1)
+    assert offset < len(all_prices), f"no price data after {month_date(start)}"
+    assert len(prices) == months, f"insufficient price data. expected range {month_date(start)} to {month_date(start + months)}. actual range {month_date(first_month + offset)} to {month_date(first_month + len(all_prices) - 1)}."
+    return prices
 
 
 def _prices_vanguard(months: int, start_month: int, start_year: int) -> list[float]:
     # data also embeds TER
-    datapath = Path(__file__).parent.parent / "data" / "all-world.csv"
     assert 1 * 12 <= months <= 20 * 12, f"insufficient data for {months} months"
     assert 1 <= start_month <= 12, f"invalid start month {start_month}"
     assert 2003 <= start_year <= 2024, f"invalid start year {start_year}"
 
-    months = int(months)
-    start_month = int(start_month)
-    start_year = int(start_year)
+    first_month, all_prices = vanguard_all_world_prices()
+    return _slice_prices(first_month, all_prices, int(months), int(start_month), int(start_year))
 
-    df = pl.read_csv(datapath).with_columns(pl.col("Date").str.to_date("%m/%Y")).select(pl.col("Date"), pl.col("^Vanguard.*$").alias("price")).sort("Date")
-    start_date = datetime.date(start_year, start_month, 1)
-    prices_df = df.filter(pl.col("Date") >= start_date).head(months)
-    prices = prices_df["price"].to_list()
-    assert len(prices) == months, f"insufficient price data. expected range {start_date} to {start_date + relativedelta(months=months)}. actual range {prices_df['Date'].min()} to {prices_df['Date'].max()}."
-    return prices
 
+def _annual_tax_vanguard(year: int | np.ndarray, total_shares: float | np.ndarray, current_price: float | np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # works on scalars as well as on arrays of paths
+    first_year, oekb_rates = oekb_vanguard_all_world()
+    known_year = (first_year <= year) & (year < first_year + len(oekb_rates))
+    known_rates = oekb_rates[np.clip(np.asarray(year) - first_year, 0, len(oekb_rates) - 1)]
+
+    # conservative estimate
+    estimated_age_rate = current_price * 0.015  # expect 1.5% dividend yield
+    estimated_step_up_rate = estimated_age_rate * 0.81  # prevent double taxation simulation (weighted by historic avg)
+    estimated_foreign_rate = estimated_age_rate * 0.1  # expect 10% of AgE to be creditable foreign tax
 
-def _annual_tax_vanguard(year: int, total_shares: float, current_price: float) -> tuple[float, float, float]:
-    oegk_data = {
-        2019: (0.4, 0.32, 0.04),
-        2020: (0.4, 0.32, 0.04),
-        2021: (0.4, 0.32, 0.04),
-        2022: (0.65, 0.52, 0.07),
-        2023: (0.65, 0.52, 0.07),
-        2024: (0.35, 0.28, 0.04),
-        2025: (1.5965, 1.2962, 0.1559),
-    }
-
-    if year in oegk_data:
-        age_rate, step_up_rate, foreign_rate = oegk_data[year]
-    else:
-        # conservative estimate
-        age_rate = current_price * 0.015  # expect 1.5% dividend yield
-        step_up_rate = age_rate * 0.81  # prevent double taxation simulation (weighted by historic avg)
-        foreign_rate = age_rate * 0.1  # expect 10% of AgE to be creditable foreign tax
+    age_rate = np.where(known_year, known_rates[..., 0], estimated_age_rate)
+    step_up_rate = np.where(known_year, known_rates[..., 1], estimated_step_up_rate)
+    foreign_rate = np.where(known_year, known_rates[..., 2], estimated_foreign_rate)
 
     hypothetical_dividends = total_shares * age_rate
     foreign_tax_credit = total_shares * foreign_rate
@@ -55,43 +57,28 @@ def _annual_tax_vanguard(year: int, total_shares: float, current_price: float) -
 
 def _prices_msci(months: int, start_month: int, start_year: int) -> list[float]:
     # data also embeds TER
-    datapath = Path(__file__).parent.parent / "data" / "msci-world.csv"
     assert 1 * 12 <= months <= 38 * 12, f"insufficient data for {months} months"
     assert 1 <= start_month <= 12, f"invalid start month {start_month}"
     assert 1987 <= start_year <= 2025, f"invalid start year {start_year}"
 
-    months = int(months)
-    start_month = int(start_month)
-    start_year = int(start_year)
+    first_month, all_prices = msci_world_prices()
+    return _slice_prices(first_month, all_prices, int(months), int(start_month), int(start_year))
 
-    df = pl.read_csv(datapath).with_columns(pl.col("Date").str.to_date("%m/%Y")).select(pl.col("Date"), pl.col("^iShares.*$").alias("price")).sort("Date")
-    start_date = datetime.date(start_year, start_month, 1)
-    prices_df = df.filter(pl.col("Date") >= start_date).head(months)
-    prices = prices_df["price"].to_list()
-    assert len(prices) == months, f"insufficient price data. expected range {start_date} to {start_date + relativedelta(months=months)}. actual range {prices_df['Date'].min()} to {prices_df['Date'].max()}."
-    return prices
 
+def _annual_tax_msci(year: int | np.ndarray, total_shares: float | np.ndarray, current_price: float | np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # works on scalars as well as on arrays of paths
+    first_year, oekb_rates = oekb_msci_world()
+    known_year = (first_year <= year) & (year < first_year + len(oekb_rates))
+    known_rates = oekb_rates[np.clip(np.asarray(year) - first_year, 0, len(oekb_rates) - 1)]
 
-def _annual_tax_msci(year: int, total_shares: float, current_price: float) -> tuple[float, float, float]:
-    oegk_data = {
-        2017: (0.3094, 0.2059, 0.0367),
-        2018: (1.4798, 1.3653, 0.0868),
-        2019: (2.3710, 2.2201, 0.0992),
-        2020: (1.6108, 1.4773, 0.1012),
-        2021: (0.3227, 0.2015, 0.0411),
-        2022: (1.4051, 1.3079, 0.0892),
-        2023: (1.3425, 1.2032, 0.1223),
-        2024: (1.4065, 1.2620, 0.1287),
-        2025: (1.4068, 1.2425, 0.1322),
-    }
-
-    if year in oegk_data:
-        age_rate, step_up_rate, foreign_rate = oegk_data[year]
-    else:
-        # conservative estimate
-        age_rate = current_price * 0.015  # expect 1.5% dividend yield
-        step_up_rate = age_rate * 0.88  # prevent double taxation simulation (weighted by historic avg)
-        foreign_rate = age_rate * 0.09  # expect 10% of AgE to be creditable foreign tax
+    # conservative estimate
+    estimated_age_rate = current_price * 0.015  # expect 1.5% dividend yield
+    estimated_step_up_rate = estimated_age_rate * 0.88  # prevent double taxation simulation (weighted by historic avg)
+    estimated_foreign_rate = estimated_age_rate * 0.09  # expect 10% of AgE to be creditable foreign tax
+
+    age_rate = np.where(known_year, known_rates[..., 0], estimated_age_rate)
+    step_up_rate = np.where(known_year, known_rates[..., 1], estimated_step_up_rate)
+    foreign_rate = np.where(known_year, known_rates[..., 2], estimated_foreign_rate)
 
     hypothetical_dividends = total_shares * age_rate
     foreign_tax_credit = total_shares * foreign_rate
@@ -100,6 +87,10 @@ def _annual_tax_msci(year: int, total_shares: float, current_price: float) -> tu
     return hypothetical_dividends, foreign_tax_credit, cost_basis_adjustment
 
 
+SPREAD_HALF = 0.0012 / 2  # 0.06% spread cost each way
+KEST = 0.275  # kapital ertragssteuer
+
+
 class Products(Enum):
     # only the most "neutral" equity ETFs that track the entire world
 
@@ -122,7 +113,20 @@ class Products(Enum):
     """
 
 
-def simulate_equity_portfolio(
+class EquityMonth(NamedTuple):
+    """
+    state of the equity portfolio at the end of a month
+    """
+
+    month: int  # `month_index`
+    price: float
+    total_shares: float
+    safe_from_tax: float  # cost basis
+    tax_paid: float  # deemed distribution tax settled by selling shares, january only
+    payout: float  # net liquidation value
+
+
+def iter_equity_portfolio(
     monthly_savings: float,
     years: int,
     start_year: int,
@@ -130,16 +134,16 @@ def simulate_equity_portfolio(
     months: int | None = None,
     cash_savings: float = 0.0,
     product: Products = Products.MSCI_WORLD,
-) -> pl.DataFrame:
+) -> Iterator[EquityMonth]:
+    """
+    month-by-month `simulate_equity_portfolio`, stop consuming whenever you like
+    """
     assert monthly_savings >= 0
     assert years > 0
     assert 1 <= start_year <= 2025
     assert 1 <= start_month <= 12
     assert months is None or months > 0
 
-    SPREAD_HALF = 0.0012 / 2  # 0.06% spread cost each way
-    KEST = 0.275  # kapital ertragssteuer
-
     buy_factor = 1.0 + SPREAD_HALF
     sell_factor = 1.0 - SPREAD_HALF
 
@@ -154,14 +158,13 @@ def simulate_equity_portfolio(
     total_shares = 0.0
     safe_from_tax = 0.0
 
-    start_date = datetime.date(start_year, start_month, 1)
-    dates = [start_date + relativedelta(months=i) for i in range(len(prices))]
-
-    payout_history = []
+    # integer month indices, dates are only materialized for the output
+    calendar = month_index(start_year, start_month) + np.arange(len(prices))
+    rents = rent_for_months(calendar).tolist()
 
-    for i, (price, current_date) in enumerate(zip(prices, dates)):
+    for i, (price, month, rent) in enumerate(zip(prices, calendar.tolist(), rents)):
         # deduct rent
-        current_investable = monthly_savings - rent_adjusted(current_date.year)
+        current_investable = monthly_savings - rent
 
         # one-time lump sum
         if i == 0:
@@ -171,10 +174,11 @@ def simulate_equity_portfolio(
         assert current_investable > 0
         total_shares += current_investable / (price * buy_factor)
         safe_from_tax += current_investable
+        tax_paid = 0.0
 
         # annual tax event in january
-        if current_date.month == 1:
-            tax_year = current_date.year - 1
+        if month % 12 == 0:
+            tax_year = month // 12 - 1
             hypothetical_dividends, foreign_tax_refund, national_tax_refund = _annual_tax(tax_year, total_shares, price)
 
             # sell shares to pay tax. models opportunity cost
@@ -186,6 +190,7 @@ def simulate_equity_portfolio(
                 shares_to_sell = tax_due / (price * sell_factor)  # don't deduct KESt for simplicity
                 safe_from_tax *= 1.0 - (shares_to_sell / total_shares)
                 total_shares -= shares_to_sell
+                tax_paid = float(tax_due)
 
         # how much if we would liquidate today?
         gross_value = total_shares * (price * sell_factor)
@@ -193,6 +198,230 @@ def simulate_equity_portfolio(
         exit_tax = taxable_value * KEST if taxable_value > 0 else 0.0
 
         payout = gross_value - exit_tax
-        payout_history.append(payout)
+        yield EquityMonth(month=month, price=price, total_shares=float(total_shares), safe_from_tax=float(safe_from_tax), tax_paid=tax_paid, payout=float(payout))
+
+
+@disk_cache
+def simulate_equity_portfolio(
+    monthly_savings: float,
+    years: int,
+    start_year: int,
+    start_month: int = 1,
+    months: int | None = None,
+    cash_savings: float = 0.0,
+    product: Products = Products.MSCI_WORLD,
+) -> pl.DataFrame:
+    payout_history = [state.payout for state in iter_equity_portfolio(monthly_savings, years, start_year, start_month, months, cash_savings, product)]
+    assert len(payout_history) > 0
+    return pl.DataFrame({"date": month_dates(month_index(start_year, start_month), len(payout_history)), "payout": payout_history})
+
+
+def _simulate_equity_paths(
+    prices: np.ndarray,
+    calendar: np.ndarray,
+    rents: np.ndarray,
+    monthly_savings: np.ndarray,
+    cash_savings: np.ndarray,
+    annual_tax: Callable[[np.ndarray, np.ndarray, np.ndarray], tuple[np.ndarray, np.ndarray, np.ndarray]],
+    spread_half: float | np.ndarray = SPREAD_HALF,
+    kest: float | np.ndarray = KEST,
+) -> np.ndarray:
+    """
+    core of the vectorized engine: (paths, months) prices, `month_index` calendar and rent matrices in, payout matrix out
+
+    `spread_half` and `kest` are scalars or one value per path
+    """
+    assert prices.shape == calendar.shape == rents.shape
+    assert monthly_savings.shape == cash_savings.shape == prices.shape[:1]
+    assert (prices > 0).all()
+
+    buy_factor = 1.0 + spread_half
+    sell_factor = 1.0 - spread_half
+
+    total_shares = np.zeros(len(prices))
+    safe_from_tax = np.zeros(len(prices))
+    payouts = np.empty(prices.shape)
+
+    for i in range(prices.shape[1]):
+        price = prices[:, i]
+
+        # deduct rent, one-time lump sum
+        current_investable = monthly_savings - rents[:, i]
+        if i == 0:
+            current_investable = current_investable + cash_savings
+
+        # buy shares
+        total_shares = total_shares + current_investable / (price * buy_factor)
+        safe_from_tax = safe_from_tax + current_investable
+
+        # annual tax event in january
+        is_january = calendar[:, i] % 12 == 0
+        if is_january.any():
+            hypothetical_dividends, foreign_tax_refund, national_tax_refund = annual_tax(calendar[:, i] // 12 - 1, total_shares, price)
+            tax_due = np.maximum(0.0, hypothetical_dividends * kest - foreign_tax_refund)
+            safe_from_tax = np.where(is_january, safe_from_tax + national_tax_refund, safe_from_tax)
+
+            sells = is_january & (tax_due > 0) & (total_shares > 0)
+            shares_to_sell = np.where(sells, tax_due / (price * sell_factor), 0.0)
+            safe_from_tax = np.where(sells, safe_from_tax * (1.0 - (shares_to_sell / np.where(sells, total_shares, 1.0))), safe_from_tax)
+            total_shares = np.where(sells, total_shares - shares_to_sell, total_shares)
+
+        # how much if we would liquidate today?
+        gross_value = total_shares * (price * sell_factor)
+        taxable_value = gross_value - safe_from_tax
+        exit_tax = np.where(taxable_value > 0, taxable_value * kest, 0.0)
+        payouts[:, i] = gross_value - exit_tax
+
+    return payouts
+
+
+def simulate_equity_batch(
+    monthly_savings: float | np.ndarray,
+    start_year: int | np.ndarray,
+    start_month: int | np.ndarray,
+    months: int | np.ndarray,
+    cash_savings: float | np.ndarray = 0.0,
+    product: Products = Products.MSCI_WORLD,
+    spread_half: float | np.ndarray = SPREAD_HALF,
+    kest: float | np.ndarray = KEST,
+) -> np.ndarray:
+    """
+    vectorized `simulate_equity_portfolio` over many paths at once
+
+    arguments broadcast against each other, one path per element.
+    returns the payouts as a (paths, months) matrix, padded with nan after each path's horizon.
+    """
+    monthly_savings, start_year, start_month, months, cash_savings, spread_half, kest = np.broadcast_arrays(*map(np.atleast_1d, (monthly_savings, start_year, start_month, months, cash_savings, spread_half, kest)))
+    assert (monthly_savings >= 0).all()
+    assert ((1 <= start_month) & (start_month <= 12)).all()
+    assert (months > 0).all()
+
+    first_month, all_prices = {Products.MSCI_WORLD: msci_world_prices, Products.VANGUARD_ALL_WORLD: vanguard_all_world_prices}[product]()
+    _prices, _annual_tax = product.value
+
+    # same data window checks as the scalar engine, once per distinct window
+    for window in set(zip(months.tolist(), start_month.tolist(), start_year.tolist())):
+        _prices(*window)
+
+    # (paths, months) calendar, frozen at the last month once a path's horizon is over
+    start_index = start_year.astype(np.int64) * 12 + start_month.astype(np.int64) - 1
+    end_index = start_index + months.astype(np.int64) - 1
+    calendar = np.minimum(start_index[:, None] + np.arange(months.max()), end_index[:, None])
+    assert start_index.min() >= first_month, "insufficient price data before start"
+    assert end_index.max() < first_month + len(all_prices), "insufficient price data after end"
+
+    rents = rent_for_months(calendar)
+    active = calendar == start_index[:, None] + np.arange(calendar.shape[1])
+    assert (monthly_savings[:, None] - rents + np.where(np.arange(calendar.shape[1]) == 0, cash_savings[:, None], 0.0) > 0)[active].all()
+
+    payouts = np.where(active, _simulate_equity_paths(all_prices[calendar - first_month], calendar, rents, monthly_savings.astype(np.float64), cash_savings.astype(np.float64), _annual_tax, spread_half.astype(np.float64), kest.astype(np.float64)), np.nan)
+    assert payouts.shape == (len(start_index), months.max())
+    assert not np.isnan(payouts[active]).any()
+    return payouts
+
+
+@disk_cache
+def simulate_blend_portfolio(
+    monthly_savings: float,
+    years: int,
+    start_year: int,
+    weights: dict[Products, float],
+    start_month: int = 1,
+    months: int | None = None,
+    cash_savings: float = 0.0,
+    rebalance_months: int | None = 12,
+) -> pl.DataFrame:
+    """
+    like `simulate_equity_portfolio`, but holding several products at target `weights`
+
+    all holdings are stepped together on a (months, products) price matrix. every product keeps its own shares, cost basis and oekb taxation.
+    contributions are split by the target weights, every `rebalance_months` the holdings are traded back to them (None: never).
+    realized gains of a rebalance are taxed right away, netted against losses as within one austrian securities account.
+    a single product at weight 1.0 reproduces `simulate_equity_portfolio`.
+    """
+    assert monthly_savings >= 0
+    assert years > 0
+    assert len(weights) > 0 and all(weight >= 0 for weight in weights.values())
+    assert abs(sum(weights.values()) - 1.0) < 1e-9, "weights must sum to 1"
+    assert rebalance_months is None or rebalance_months > 0
+
+    buy_factor = 1.0 + SPREAD_HALF
+    sell_factor = 1.0 - SPREAD_HALF
+
+    if months is None:
+        months = years * 12
+
+    products = list(weights)
+    target = np.array([weights[product] for product in products])
+    prices = np.array([product.value[0](months, start_month, start_year) for product in products]).T
+    assert prices.shape == (months, len(products))
+
+    total_shares = np.zeros(len(products))
+    safe_from_tax = np.zeros(len(products))
+
+    calendar = month_index(start_year, start_month) + np.arange(months)
+    rents = rent_for_months(calendar).tolist()
+
+    payout_history = []
+    value_history = []
+
+    for i, (price, month, rent) in enumerate(zip(prices, calendar.tolist(), rents)):
+        # deduct rent
+        current_investable = monthly_savings - rent
+
+        # one-time lump sum
+        if i == 0:
+            current_investable += cash_savings
+
+        # buy shares at the target weights
+        assert current_investable > 0
+        total_shares = total_shares + (current_investable * target) / (price * buy_factor)
+        safe_from_tax = safe_from_tax + current_investable * target
+
+        # annual tax event in january, per product
+        if month % 12 == 0:
+            tax_year = month // 12 - 1
+            for k, product in enumerate(products):
+                hypothetical_dividends, foreign_tax_refund, national_tax_refund = product.value[1](tax_year, total_shares[k], price[k])
+
+                # sell shares to pay tax. models opportunity cost
+                tax_due = max(0.0, hypothetical_dividends * KEST - foreign_tax_refund)
+
+                safe_from_tax[k] += national_tax_refund
+
+                if tax_due > 0 and total_shares[k] > 0:
+                    shares_to_sell = tax_due / (price[k] * sell_factor)  # don't deduct KESt for simplicity
+                    safe_from_tax[k] *= 1.0 - (shares_to_sell / total_shares[k])
+                    total_shares[k] -= shares_to_sell
+
+        # trade back to the target weights
+        if rebalance_months is not None and i > 0 and i % rebalance_months == 0:
+            values = total_shares * (price * sell_factor)
+            excess = values - values.sum() * target
+            # fraction of each holding to sell, drift below a cent is rounding and not traded (nothing would be bought back)
+            sold = np.where(excess > 0.01, excess / values.clip(min=1e-12), 0.0)
+            if sold.any():
+                proceeds = values * sold
+                realized_gain = (proceeds - safe_from_tax * sold).sum()
+                proceeds_after_tax = proceeds.sum() - max(0.0, realized_gain) * KEST
+                total_shares = total_shares * (1.0 - sold)
+                safe_from_tax = safe_from_tax * (1.0 - sold)
+
+                shortfall = np.maximum(-excess, 0.0)
+                assert shortfall.sum() > 0
+                purchases = proceeds_after_tax * shortfall / shortfall.sum()
+                total_shares = total_shares + purchases / (price * buy_factor)
+                safe_from_tax = safe_from_tax + purchases
+
+        # how much if we would liquidate today? losses offset gains across products
+        values = total_shares * (price * sell_factor)
+        taxable_value = values.sum() - safe_from_tax.sum()
+        exit_tax = taxable_value * KEST if taxable_value > 0 else 0.0
+
+        payout_history.append(values.sum() - exit_tax)
+        value_history.append(values)
 
-    return pl.DataFrame({"date": dates, "payout": payout_history})
+    value_history = np.array(value_history)
+    assert value_history.shape == prices.shape
+    assert len(payout_history) == months
+    return pl.DataFrame({"date": month_dates(int(calendar[0]), months), "payout": payout_history} | {f"{product.name.lower()}_value": value_history[:, k] for k, product in enumerate(products)})
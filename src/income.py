@@ -1,31 +1,48 @@
 from enum import Enum
-from pathlib import Path
+from itertools import accumulate
 
-import polars as pl
+import numpy as np
 
+from market_data import rppi_first, rppi_last
+from profiling import counted
 
-def _net_special(gross_special_payments: float) -> float:
-    assert 0 <= gross_special_payments < 1e12
+# all salary functions take arrays of salaries, so whole income distributions are computed at once
+
+
+def _round_cents(values: np.ndarray | float) -> np.ndarray | float:
+    # np.round scales by 100 first, which can tip values within float error of a half cent the other way than `round`
+    values = np.asarray(values, dtype=np.float64)
+    flat = np.atleast_1d(values)
+    rounded = np.round(flat, 2)
+    near_half_cent = np.abs(np.abs(flat * 100 % 1) - 0.5) < 1e-6
+    rounded[near_half_cent] = [round(value, 2) for value in flat[near_half_cent].tolist()]
+    assert rounded.shape == flat.shape
+    assert np.all(np.abs(rounded - flat) <= 0.005 + 1e-9 * np.abs(flat))
+    return rounded.reshape(values.shape)[()]  # scalars stay scalars
+
+
+def _net_special(gross_special_payments: np.ndarray) -> np.ndarray:
+    assert np.all((0 <= gross_special_payments) & (gross_special_payments < 1e12))
     # social insurance
-    sv_base = min(gross_special_payments, 12900.00)  # höchstbeitragsgrundlage sonderzahlungen, ASVG §108
-    social_insurance = round(sv_base * 0.1707, 2)  # spacial payments rate
-    assert social_insurance <= gross_special_payments
+    sv_base = np.minimum(gross_special_payments, 12900.00)  # höchstbeitragsgrundlage sonderzahlungen, ASVG §108
+    social_insurance = _round_cents(sv_base * 0.1707)  # spacial payments rate
+    assert np.all(social_insurance <= gross_special_payments)
 
     # income tax
     taxable_base = gross_special_payments - social_insurance
     tax_free_amount = 620.00 * 2  # first 620 EUR of both payments are tax-free, EStG §67 (1) greibetrag
-    taxed_amount = max(0.00, taxable_base - tax_free_amount)
-    income_tax = round(taxed_amount * 0.06, 2)  # sechstel-tarif EStG §67 (1)
+    taxed_amount = np.maximum(0.00, taxable_base - tax_free_amount)
+    income_tax = _round_cents(taxed_amount * 0.06)  # sechstel-tarif EStG §67 (1)
 
     net_salary = gross_special_payments - social_insurance - income_tax
 
-    result = round(net_salary, 2)
-    assert 0 <= result <= gross_special_payments + 0.01
+    result = _round_cents(net_salary)
+    assert np.all((0 <= result) & (result <= gross_special_payments + 0.01))
     return result
 
 
-def _tax_monthly(taxable_income: float) -> float:
-    assert 0 <= taxable_income < 1e12
+def _tax_monthly(taxable_income: np.ndarray) -> np.ndarray:
+    assert np.all((0 <= taxable_income) & (taxable_income < 1e12))
     tax_brackets = [
         (1037.33, 0.00),
         (1620.67, 0.20),
@@ -34,67 +51,70 @@ def _tax_monthly(taxable_income: float) -> float:
         (7760.00, 0.48),
         (float("inf"), 0.50),
     ]
-
-    if taxable_income <= tax_brackets[0][0]:
-        return 0.00
-
-    income_tax = 0.00
-    previous_limit = 0.00
+    limits = np.array([limit for limit, _ in tax_brackets])
+    rates = np.array([rate for _, rate in tax_brackets])
+    lower_limits = np.array([0.00] + [limit for limit, _ in tax_brackets[:-1]])
 
     # progressive tax brackets, einkommensteuertarif, EStG § 33
-    for limit, rate in tax_brackets:
-        if taxable_income > previous_limit:
-            taxable_in_bracket = min(taxable_income, limit) - previous_limit
-            income_tax += taxable_in_bracket * rate
-            previous_limit = limit
-
-            if taxable_income <= limit:
-                break
+    # tax of all brackets below, summed in bracket order
+    tax_below = np.array(list(accumulate([(limit - lower) * rate for (limit, rate), lower in zip(tax_brackets[:-1], lower_limits)], initial=0.00)))
+    bracket = np.searchsorted(limits, taxable_income, side="left")
+    income_tax = np.where(bracket == 0, 0.00, tax_below[bracket] + (taxable_income - lower_limits[bracket]) * rates[bracket])
+    assert np.all(income_tax >= 0)
 
     # estimated tax deductibles, arbeitnehmerabsetzbetrag/berkehrsabsetzbetrag, EStG § 33
-    income_tax = max(0.00, income_tax - 104.63)
-    result = round(income_tax, 2)
-    assert result >= 0
+    income_tax = np.maximum(0.00, income_tax - 104.63)
+    result = _round_cents(income_tax)
+    assert np.all(result >= 0)
     return result
 
 
-def _net_running(gross_salary_monthly: float) -> float:
-    assert 0 <= gross_salary_monthly < 1e12
+def _net_running(gross_salary_monthly: np.ndarray) -> np.ndarray:
+    assert np.all((0 <= gross_salary_monthly) & (gross_salary_monthly < 1e12))
     gross = gross_salary_monthly
 
     # social insurance
-    sv_base = min(gross, 6090.00)  # höchstbeitragsgrundlage, ASVG §108
-    social_insurance = round(sv_base * 0.1812, 2)  # standard rate
-    assert social_insurance <= gross
+    sv_base = np.minimum(gross, 6090.00)  # höchstbeitragsgrundlage, ASVG §108
+    social_insurance = _round_cents(sv_base * 0.1812)  # standard rate
+    assert np.all(social_insurance <= gross)
 
     # income tax
     taxable_income = gross - social_insurance
     income_tax = _tax_monthly(taxable_income)
     net_salary = gross - social_insurance - income_tax
-    result = round(net_salary, 2)
-    assert 0 <= result <= gross_salary_monthly + 0.01
+    result = _round_cents(net_salary)
+    assert np.all((0 <= result) & (result <= gross_salary_monthly + 0.01))
     return result
 
 
-def _net_salary_annual(annual_gross_salary: float) -> float:
-    assert 0 <= annual_gross_salary < 1e13
+def net_salary_annual_batch(annual_gross_salaries: np.ndarray) -> np.ndarray:
+    """
+    annual net salary for every gross salary in the array
+    """
     # based on: https://bruttonetto.arbeiterkammer.at/
-    if annual_gross_salary <= 0:
-        return 0
+    annual_gross_salaries = np.asarray(annual_gross_salaries, dtype=np.float64)
+    assert np.all((0 <= annual_gross_salaries) & (annual_gross_salaries < 1e13))
 
     # 12x running payments
-    gross_monthly_running = annual_gross_salary / 14
+    gross_monthly_running = annual_gross_salaries / 14
     net_monthly = _net_running(gross_monthly_running)
 
     # 2x special payments (13th/14th)
     gross_special_payments = 2 * gross_monthly_running
     net_special = _net_special(gross_special_payments)
 
-    result = 12 * net_monthly + net_special
-    assert result >= 0
+    result = np.where(annual_gross_salaries <= 0, 0.0, 12 * net_monthly + net_special)
+    assert result.shape == annual_gross_salaries.shape
+    assert np.all(result >= 0)
     return result
 
 
+def _net_salary_annual(annual_gross_salary: float) -> float:
+    result = net_salary_annual_batch(np.array([annual_gross_salary]))
+    assert result.shape == (1,)
+    return float(result[0])
+
+
 class IncomePercentile(Enum):
     # based on: https://www.levels.fyi/heatmap/europe/
     pct_10th = 28_600
@@ -104,7 +124,10 @@ class IncomePercentile(Enum):
     pct_90th = 91_300
 
 
-def net_savings_monthly(income_annual: IncomePercentile) -> float:
+def net_savings_monthly_batch(annual_gross_salaries: np.ndarray) -> np.ndarray:
+    """
+    average monthly savings after living costs for every gross salary in the array
+    """
     cost_of_living = {
         # single person in vienna, 1bd apartment, not overly frugal or lavish
         # based on:
@@ -119,10 +142,18 @@ def net_savings_monthly(income_annual: IncomePercentile) -> float:
 
     # avg monthly savings, smoothing the 13th/14th salary over the year
     annual_expenses = sum(cost_of_living.values()) * 12
-    net_annual_salary = _net_salary_annual(income_annual.value)
+    net_annual_salary = net_salary_annual_batch(annual_gross_salaries)
     return (net_annual_salary - annual_expenses) / 12
 
 
+def net_savings_monthly(income_annual: IncomePercentile) -> float:
+    result = net_savings_monthly_batch(np.array([income_annual.value]))
+    assert result.shape == (1,)
+    assert np.isfinite(result).all()
+    return float(result[0])
+
+
+@counted
 def rent_adjusted(year: int) -> float:
     """
     monthly rent adjusted for inflation
@@ -133,17 +164,17 @@ def rent_adjusted(year: int) -> float:
     BASELINE_RENT = 850.00
     BASELINE_YEAR = 2024
 
-    datapath = Path(__file__).parent.parent / "data" / "rppi.csv"
-    value_increase = (
-        pl.read_csv(datapath)
-        # track price changes
-        .filter(pl.col("period") == "quarter")
-        .filter(pl.col("indicator") == "Real estate price index, Vienna, apartments total, 2000=100")
-        # filter year
-        .select(pl.col("year"), pl.col("quarter"), pl.col("values"))
-        .filter((pl.col("year") >= int(year)) & (pl.col("year") <= BASELINE_YEAR))
-        # compute ratio
-        .select(pl.col("values").first() / pl.col("values").last())
-        .item()
-    )
+    value_increase = rppi_first(year) / rppi_last(BASELINE_YEAR)
     return BASELINE_RENT * value_increase
+
+
+def rent_for_months(calendar: np.ndarray) -> np.ndarray:
+    """
+    `rent_adjusted` for an array of `month_index` values, evaluated once per distinct year
+    """
+    calendar = np.asarray(calendar)
+    first_year = int(calendar.min()) // 12
+    rents = np.array([rent_adjusted(year) for year in range(first_year, int(calendar.max()) // 12 + 1)])[calendar // 12 - first_year]
+    assert rents.shape == calendar.shape
+    assert (rents > 0).all()
+    return rents
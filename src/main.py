@@ -1,94 +1,99 @@
-from datetime import datetime
+import argparse
+import sys
+from pathlib import Path
 
-import plotille
 import polars as pl
-from plotnine import aes, element_text, geom_line, geom_text, ggplot, labs, scale_x_date, scale_y_continuous, theme, theme_minimal
 
 from equity import Products, simulate_equity_portfolio
 from income import IncomePercentile
+from market_data import load_all
+from profiling import enable, stage
 from real_estate import estimate_mortgage_payoff_years, simulate_real_estate_portfolio
 
 
-def plot_comparison(df: pl.DataFrame):
-    last_rows = df.group_by("strategy").last()
-
-    p = (
-        ggplot(df, aes(x="date", y="payout", color="strategy"))
-        + geom_line(size=1)
-        + geom_text(
-            last_rows,
-            aes(label="payout"),
-            va="bottom",
-            ha="right",
-            size=10,
-            format_string="{:,.0f}€",
-            nudge_y=20000,
-            show_legend=False,
-        )
-        + theme_minimal()
-        + labs(title="Equity vs Real Estate Portfolio Value Over Time", subtitle="Comparison of two strategies (initial lump sum + monthly savings)", x="Date", y="Net Worth (EUR)", color="Strategy")
-        + theme(
-            figure_size=(10, 6),
-            axis_text_x=element_text(rotation=45, hjust=1),
-            plot_title=element_text(size=16, weight="bold"),
-            legend_position="bottom",
-        )
-        + scale_y_continuous(labels=lambda label: [f"{x:,.0f}€" for x in label])
-        + scale_x_date(expand=(0.1, 0.1))
-    )
-
-    p.save(f"assets/comparison_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf")
-    p.show()
-
-
-def plot_comparison_ascii(df: pl.DataFrame):
-    fig = plotille.Figure()
-    fig.width = 80
-    fig.height = 30
-
-    for (name,), data in df.group_by(["strategy"]):
-        data = data.sort("date")
-        x = data["date"].dt.year() + (data["date"].dt.month() - 1) / 12.0
-        y = data["payout"]
-        fig.plot(x, y, label=str(name))
-
-    print(fig.show(legend=True))
-
-
-def run_comparison():
-    INITIAL_LUMP_SUM = 130_000
-    PROPERTY_PRICE = 500_000
-    INCOME = IncomePercentile.pct_75th.value / 12
-    START_YEAR = 1994
-    YEARS = int(estimate_mortgage_payoff_years(INCOME, INITIAL_LUMP_SUM, PROPERTY_PRICE)) + 10
-
-    equity_df = simulate_equity_portfolio(
-        monthly_savings=INCOME,
-        years=YEARS,
-        start_year=START_YEAR,
-        cash_savings=INITIAL_LUMP_SUM,
-        product=Products.MSCI_WORLD,
-    ).with_columns(pl.lit("Equity ETF").alias("strategy"))
-    print("--- equity strategy:")
-    print(equity_df.head(1).row(0))
-    print(equity_df.tail(1).row(0))
-
-    real_estate_df = simulate_real_estate_portfolio(
-        monthly_savings=INCOME,
-        years=YEARS,
-        start_year=START_YEAR,
-        purchase_price=PROPERTY_PRICE,
-        cash_savings=INITIAL_LUMP_SUM,
-    ).with_columns(pl.lit("Real Estate").alias("strategy"))
-    print("--- real estate strategy:")
-    print(real_estate_df.head(1).row(0))
-    print(real_estate_df.tail(1).row(0))
+def run_comparison(
+    lump_sum: float = 130_000,
+    purchase_price: float = 500_000,
+    income: IncomePercentile = IncomePercentile.pct_75th,
+    start_year: int = 1994,
+    years: int | None = None,
+    product: Products = Products.MSCI_WORLD,
+    valuation: str = "monthly",
+) -> pl.DataFrame:
+    """
+    both strategies side by side, `years` defaults to the mortgage payoff time plus 10 years
+    """
+    assert lump_sum >= 0
+    assert purchase_price > 0
+    assert years is None or years > 0
+
+    INITIAL_LUMP_SUM = lump_sum
+    PROPERTY_PRICE = purchase_price
+    INCOME = income.value / 12
+    START_YEAR = start_year
+
+    with stage("data load"):
+        load_all()
+
+    with stage("mortgage payoff estimate"):
+        YEARS = years or int(estimate_mortgage_payoff_years(INCOME, INITIAL_LUMP_SUM, PROPERTY_PRICE)) + 10
+
+    with stage("equity path"):
+        equity_df = simulate_equity_portfolio(
+            monthly_savings=INCOME,
+            years=YEARS,
+            start_year=START_YEAR,
+            cash_savings=INITIAL_LUMP_SUM,
+            product=product,
+        ).with_columns(pl.lit("Equity ETF").alias("strategy"))
+
+    with stage("real-estate path"):
+        real_estate_df = simulate_real_estate_portfolio(
+            monthly_savings=INCOME,
+            years=YEARS,
+            start_year=START_YEAR,
+            purchase_price=PROPERTY_PRICE,
+            cash_savings=INITIAL_LUMP_SUM,
+            valuation=valuation,
+        ).with_columns(pl.lit("Real Estate").alias("strategy"))
 
     df = pl.concat([equity_df, real_estate_df])
     return df
 
 
 if __name__ == "__main__":
-    df = run_comparison()
-    plot_comparison_ascii(df)
-    plot_comparison(df)
+    parser = argparse.ArgumentParser(description="compare renting + investing in equity ETFs against buying real estate")
+    parser.add_argument("--lump-sum", type=float, default=130_000, help="initial cash savings (default: %(default)s)")
+    parser.add_argument("--price", type=float, default=500_000, help="property purchase price (default: %(default)s)")
+    parser.add_argument("--income", choices=[percentile.name for percentile in IncomePercentile], default=IncomePercentile.pct_75th.name)
+    parser.add_argument("--start-year", type=int, default=1994)
+    parser.add_argument("--years", type=int, help="horizon (default: mortgage payoff time plus 10 years)")
+    parser.add_argument("--product", choices=[product.name for product in Products], default=Products.MSCI_WORLD.name)
+    parser.add_argument("--valuation", choices=["monthly", "annual"], default="monthly", help="reprice the property monthly (interpolated rppi) or once per year")
+    parser.add_argument("--output", choices=["json", "parquet", "csv"], help="write results instead of plotting, never imports a plotting library")
+    parser.add_argument("--out", type=Path, help="output file (default: stdout, required for parquet)")
+    parser.add_argument("--profile", nargs="?", const="table", help="report stage timings, call counts, csv reads and cache hit rates: table (default), json or a .json path")
+    args = parser.parse_args()
+    if args.output == "parquet" and args.out is None:
+        parser.error("--output parquet requires --out")
+    if args.profile:
+        enable(args.profile)
+
+    df = run_comparison(lump_sum=args.lump_sum, purchase_price=args.price, income=IncomePercentile[args.income], start_year=args.start_year, years=args.years, product=Products[args.product], valuation=args.valuation)
+
+    if args.output:
+        with stage("output"):
+            destination = args.out or sys.stdout
+            {"json": df.write_json, "parquet": df.write_parquet, "csv": df.write_csv}[args.output](destination)
+        sys.exit(0)
+
+    for (strategy,), strategy_df in df.group_by(["strategy"], maintain_order=True):
+        print(f"--- {strategy.lower()} strategy:")
+        print(strategy_df.head(1).row(0))
+        print(strategy_df.tail(1).row(0))
+
+    with stage("plotting"):
+        from plotting import plot_comparison, plot_comparison_ascii  # heavy imports, only when plotting
+
+        plot_comparison_ascii(df)
+        plot_comparison(df)
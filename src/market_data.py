@@ -0,0 +1,302 @@
+"""
+process-wide market data store
+
+every source file is parsed once per process and exposed as pre-sorted, gap-free numpy arrays.
+a series is a `(start, values)` pair where `values[i]` belongs to period `start + i`, so lookups are plain array offsets.
+
+the csvs are compiled into memory-mapped `.npy` files under `data/compiled`, rebuilt whenever a source file changes.
+run `python market_data.py` to compile them ahead of time.
+"""
+
+import datetime
+import hashlib
+import json
+import os
+from functools import cache
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+
+from profiling import record_csv_read, watch_cache
+
+DATA_DIR = Path(__file__).parent.parent / "data"
+COMPILED_DIR = DATA_DIR / "compiled"
+
+RPPI_INDICATOR = "Real estate price index, Vienna, apartments total, 2000=100"
+
+# oekb deemed distribution income per share: year -> (AgE, cost basis step-up, creditable foreign tax)
+OEKB_VANGUARD_ALL_WORLD = {
+    2019: (0.4, 0.32, 0.04),
+    2020: (0.4, 0.32, 0.04),
+    2021: (0.4, 0.32, 0.04),
+    2022: (0.65, 0.52, 0.07),
+    2023: (0.65, 0.52, 0.07),
+    2024: (0.35, 0.28, 0.04),
+    2025: (1.5965, 1.2962, 0.1559),
+}
+
+OEKB_MSCI_WORLD = {
+    2017: (0.3094, 0.2059, 0.0367),
+    2018: (1.4798, 1.3653, 0.0868),
+    2019: (2.3710, 2.2201, 0.0992),
+    2020: (1.6108, 1.4773, 0.1012),
+    2021: (0.3227, 0.2015, 0.0411),
+    2022: (1.4051, 1.3079, 0.0892),
+    2023: (1.3425, 1.2032, 0.1223),
+    2024: (1.4065, 1.2620, 0.1287),
+    2025: (1.4068, 1.2425, 0.1322),
+}
+
+
+def month_index(year: int, month: int) -> int:
+    assert 1 <= month <= 12, f"invalid month {month}"
+    assert 0 < year < 10_000, f"invalid year {year}"
+    result = int(year) * 12 + int(month) - 1
+    assert result >= 0
+    return result
+
+
+def month_dates(first_month: int, months: int) -> pl.Series:
+    """
+    first-of-month dates of `months` consecutive month indices, for output dataframes
+    """
+    assert months > 0
+    month_date = lambda index: datetime.date(index // 12, index % 12 + 1, 1)
+    dates = pl.date_range(month_date(first_month), month_date(first_month + months - 1), "1mo", eager=True)
+    assert len(dates) == months
+    return dates
+
+
+def _freeze(values: np.ndarray) -> np.ndarray:
+    # shared across all callers, so nobody may mutate it in place
+    values = np.ascontiguousarray(values, dtype=np.float64)
+    values.flags.writeable = False
+    assert values.ndim >= 1
+    assert np.isfinite(values).all(), "market data contains gaps"
+    return values
+
+
+def _parse_etf_prices(path: Path, column_pattern: str) -> tuple[int, np.ndarray]:
+    record_csv_read(path)
+    df = pl.read_csv(path).with_columns(pl.col("Date").str.to_date("%m/%Y")).select(pl.col("Date"), pl.col(column_pattern).alias("price")).sort("Date")
+    months = (df["Date"].dt.year().cast(pl.Int64) * 12 + df["Date"].dt.month().cast(pl.Int64) - 1).to_numpy()
+    assert len(months) > 0, f"no prices in {path.name}"
+    assert (np.diff(months) == 1).all(), f"{path.name} is not a gap-free monthly series"
+
+    return int(months[0]), df["price"].to_numpy()
+
+
+def _parse_rppi(path: Path) -> tuple[int, np.ndarray]:
+    record_csv_read(path)
+    df = (
+        pl.read_csv(path)
+        # track price changes
+        .filter(pl.col("period") == "quarter")
+        .filter(pl.col("indicator") == RPPI_INDICATOR)
+        # one row per quarter, oldest first
+        .select(pl.col("year").cast(pl.Int64), pl.col("quarter").cast(pl.Int64), pl.col("values"))
+        .sort("year", "quarter")
+    )
+    quarters = (df["year"] * 4 + df["quarter"] - 1).to_numpy()
+    assert len(quarters) > 0, "no rppi data"
+    assert (np.diff(quarters) == 1).all(), "rppi is not a gap-free quarterly series"
+
+    return int(quarters[0]), df["values"].to_numpy()
+
+
+# series name -> (source csv, parser)
+_SERIES = {
+    "msci_world": ("msci-world.csv", lambda path: _parse_etf_prices(path, "^iShares.*$")),
+    "vanguard_all_world": ("all-world.csv", lambda path: _parse_etf_prices(path, "^Vanguard.*$")),
+    "rppi_vienna_apartments": ("rppi.csv", _parse_rppi),
+}
+
+
+def _source_hash(filename: str) -> str:
+    return hashlib.sha256((DATA_DIR / filename).read_bytes()).hexdigest()
+
+
+def compile_dataset() -> dict:
+    """
+    parse every source csv once into a float64 `.npy` per series, listed in `manifest.json` with start offset and source hash
+    """
+    COMPILED_DIR.mkdir(parents=True, exist_ok=True)
+    manifest = {}
+    for name, (filename, parse) in _SERIES.items():
+        start, values = parse(DATA_DIR / filename)
+        digest = _source_hash(filename)
+        # the hash in the file name keeps readers of an older manifest on consistent arrays
+        path = COMPILED_DIR / f"{name}-{digest[:16]}.npy"
+        partial_path = COMPILED_DIR / f"{name}.{os.getpid()}.tmp.npy"
+        np.save(partial_path, np.ascontiguousarray(values, dtype=np.float64))
+        os.replace(partial_path, path)
+        manifest[name] = {"source": filename, "sha256": digest, "file": path.name, "start": start, "length": len(values)}
+
+    partial_path = COMPILED_DIR / f"manifest.{os.getpid()}.tmp"
+    partial_path.write_text(json.dumps(manifest, indent=2) + "\n")
+    os.replace(partial_path, COMPILED_DIR / "manifest.json")
+
+    # mapped pages of unlinked files stay valid for processes still using them
+    current = {entry["file"] for entry in manifest.values()}
+    for path in COMPILED_DIR.glob("*.npy"):
+        if path.name not in current and ".tmp." not in path.name:
+            path.unlink(missing_ok=True)
+
+    assert set(manifest) == set(_SERIES)
+    assert all(entry["length"] > 0 for entry in manifest.values())
+    return manifest
+
+
+@cache
+def _series(name: str) -> tuple[int, np.ndarray]:
+    filename, _ = _SERIES[name]
+    manifest_path = COMPILED_DIR / "manifest.json"
+    manifest = json.loads(manifest_path.read_text()) if manifest_path.exists() else {}
+    entry = manifest.get(name)
+    if entry is None or entry["sha256"] != _source_hash(filename) or not (COMPILED_DIR / entry["file"]).exists():
+        entry = compile_dataset()[name]
+
+    # zero-copy: pages are shared with every other process mapping the same file
+    values = np.load(COMPILED_DIR / entry["file"], mmap_mode="r")
+    assert values.dtype == np.float64
+    assert len(values) == entry["length"], f"{entry['file']} does not match the manifest"
+    return int(entry["start"]), _freeze(values)
+
+
+def msci_world_prices() -> tuple[int, np.ndarray]:
+    """
+    monthly prices of the iShares MSCI ACWI ETF, indexed by `month_index`
+    """
+    return _series("msci_world")
+
+
+def vanguard_all_world_prices() -> tuple[int, np.ndarray]:
+    """
+    monthly prices of the Vanguard FTSE All-World ETF, indexed by `month_index`
+    """
+    return _series("vanguard_all_world")
+
+
+def rppi_vienna_apartments() -> tuple[int, np.ndarray]:
+    """
+    quarterly vienna apartment price index, indexed by `year * 4 + quarter - 1`
+    """
+    return _series("rppi_vienna_apartments")
+
+
+def rppi_first(year: int) -> float:
+    """
+    index value of the earliest quarter in or after `year`
+    """
+    start, values = rppi_vienna_apartments()
+    offset = max(int(year) * 4, start) - start
+    assert 0 <= offset < len(values), f"no rppi data in or after {year}"
+    result = float(values[offset])
+    assert result > 0
+    return result
+
+
+def rppi_last(year: int) -> float:
+    """
+    index value of the latest quarter in or before `year`
+    """
+    start, values = rppi_vienna_apartments()
+    offset = min(int(year) * 4 + 3, start + len(values) - 1) - start
+    assert 0 <= offset < len(values), f"no rppi data in or before {year}"
+    result = float(values[offset])
+    assert result > 0
+    return result
+
+
+@cache
+def rppi_monthly() -> tuple[int, np.ndarray]:
+    """
+    rppi interpolated linearly between quarter midpoints, indexed by `month_index`
+    """
+    first_quarter, quarterly = rppi_vienna_apartments()
+    first_month = first_quarter * 3
+    midpoints = first_month + 3 * np.arange(len(quarterly)) + 1
+    values = np.interp(np.arange(first_month, first_month + 3 * len(quarterly)), midpoints, quarterly)  # flat before the first and after the last midpoint
+    assert len(values) == 3 * len(quarterly)
+    return first_month, _freeze(values)
+
+
+def rppi_at(months: int | np.ndarray) -> float | np.ndarray:
+    """
+    monthly rppi of one or many `month_index` values, clamped to the covered range like `rppi_first` / `rppi_last`
+    """
+    start, values = rppi_monthly()
+    result = values[np.clip(np.asarray(months) - start, 0, len(values) - 1)]
+    assert (result > 0).all()
+    return float(result) if np.ndim(result) == 0 else result
+
+
+@cache
+def _oekb_rates(product: str) -> tuple[int, np.ndarray]:
+    table = {"vanguard": OEKB_VANGUARD_ALL_WORLD, "msci": OEKB_MSCI_WORLD}[product]
+    years = sorted(table)
+    assert years == list(range(years[0], years[-1] + 1)), f"oekb table for {product} has gaps"
+    rates = np.array([table[year] for year in years])
+    assert rates.shape == (len(years), 3)
+    return years[0], _freeze(rates)
+
+
+def oekb_vanguard_all_world() -> tuple[int, np.ndarray]:
+    """
+    yearly (AgE, step-up, foreign tax) rates per share, indexed by year
+    """
+    return _oekb_rates("vanguard")
+
+
+def oekb_msci_world() -> tuple[int, np.ndarray]:
+    """
+    yearly (AgE, step-up, foreign tax) rates per share, indexed by year
+    """
+    return _oekb_rates("msci")
+
+
+def rate_series_hash(path: str | Path) -> str:
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+
+def load_rate_series(path: str | Path, date_column: str = "date", rate_column: str = "rate", date_format: str = "%Y-%m", percent: bool = True) -> tuple[int, np.ndarray]:
+    """
+    monthly reference interest rates (e.g. 3M Euribor) from a csv you provide, as annual fractions indexed by `month_index`
+
+    no rate data ships with the repository, e.g. export the series from the ECB data portal.
+    the file is parsed once per content, edits are picked up on the next call.
+    """
+    return _load_rate_series(Path(path), rate_series_hash(path), date_column, rate_column, date_format, percent)
+
+
+@cache
+def _load_rate_series(path: Path, content_hash: str, date_column: str, rate_column: str, date_format: str, percent: bool) -> tuple[int, np.ndarray]:
+    record_csv_read(path)
+    df = pl.read_csv(path).select(pl.col(date_column).cast(pl.String).str.to_date(date_format).alias("date"), pl.col(rate_column).cast(pl.Float64).alias("rate")).sort("date")
+    months = (df["date"].dt.year().cast(pl.Int64) * 12 + df["date"].dt.month().cast(pl.Int64) - 1).to_numpy()
+    assert len(months) > 0, f"no rates in {path.name}"
+    assert (np.diff(months) == 1).all(), f"{path.name} is not a gap-free monthly series"
+
+    rates = df["rate"].to_numpy() / (100.0 if percent else 1.0)
+    return int(months[0]), _freeze(rates)
+
+
+watch_cache("market_data.series", lambda: _series.cache_info()[:2])
+watch_cache("market_data.rppi_monthly", lambda: rppi_monthly.cache_info()[:2])
+
+
+def load_all() -> None:
+    """
+    warm up the store, e.g. before forking worker processes
+    """
+    loaders = [msci_world_prices, vanguard_all_world_prices, rppi_vienna_apartments, rppi_monthly, oekb_msci_world, oekb_vanguard_all_world]
+    series = [loader() for loader in loaders]
+    assert all(len(values) > 0 for _, values in series)
+    assert all(not values.flags.writeable for _, values in series)
+    assert _series.cache_info().currsize == len(_SERIES)
+
+
+if __name__ == "__main__":
+    for name, entry in compile_dataset().items():
+        print(f"{name:<25} {entry['length']:>5} values from {entry['source']} -> {COMPILED_DIR / entry['file']}")
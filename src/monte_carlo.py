@@ -0,0 +1,223 @@
+"""
+block-bootstrap monte carlo over synthetic market histories
+
+monthly etf returns and vienna rppi returns are resampled together in quarter-aligned blocks, so their co-movement and short-term momentum survive.
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+import polars as pl
+
+from checkpoint import Checkpoint, run_checkpointed
+from equity import Products, _simulate_equity_paths
+from income import IncomePercentile, rent_adjusted
+from market_data import load_all, month_index, msci_world_prices, rppi_vienna_apartments, vanguard_all_world_prices
+from real_estate import _monthly_ownership_costs, estimate_mortgage_payoff_years
+from scenario_results import ScenarioResults
+
+
+class MonteCarloPaths(NamedTuple):
+    """
+    net worth of both strategies in one chunk, shape (paths, months)
+    """
+
+    equity: np.ndarray
+    real_estate: np.ndarray
+
+
+def joint_monthly_returns(product: Products = Products.MSCI_WORLD) -> np.ndarray:
+    """
+    (months, 2) gross returns of [etf, rppi] over the months both series cover, starting and ending on quarter boundaries
+
+    the quarterly rppi return is spread evenly over its three months.
+    """
+    first_month, prices = {Products.MSCI_WORLD: msci_world_prices, Products.VANGUARD_ALL_WORLD: vanguard_all_world_prices}[product]()
+    first_quarter, rppi = rppi_vienna_apartments()
+
+    etf_returns = prices[1:] / prices[:-1]  # etf_returns[i] is the return of month first_month + 1 + i
+    rppi_returns = np.repeat((rppi[1:] / rppi[:-1]) ** (1 / 3), 3)  # rppi_returns[i] is the return of month (first_quarter + 1) * 3 + i
+
+    etf_start, rppi_start = first_month + 1, (first_quarter + 1) * 3
+    start = -(-max(etf_start, rppi_start) // 3) * 3
+    end = min(etf_start + len(etf_returns), rppi_start + len(rppi_returns)) // 3 * 3
+    assert end - start >= 4 * 12, "series overlap too short to bootstrap"
+
+    returns = np.column_stack([etf_returns[start - etf_start : end - etf_start], rppi_returns[start - rppi_start : end - rppi_start]])
+    assert returns.shape == (end - start, 2)
+    assert (returns > 0).all()
+    return returns
+
+
+def block_bootstrap(returns: np.ndarray, n_paths: int, months: int, block_months: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    (paths, months, series) resampled returns, glued together from random quarter-aligned historical blocks
+    """
+    assert returns.ndim == 2 and len(returns) % 3 == 0
+    assert 0 < block_months <= len(returns) and block_months % 3 == 0, "blocks must cover whole quarters"
+    assert n_paths > 0 and months > 0
+
+    n_blocks = -(-months // block_months)
+    block_starts = 3 * rng.integers(0, (len(returns) - block_months) // 3 + 1, size=(n_paths, n_blocks))
+    rows = (block_starts[:, :, None] + np.arange(block_months)).reshape(n_paths, -1)[:, :months]
+    return returns[rows]
+
+
+def _simulate_chunk(
+    seed: np.random.SeedSequence,
+    n_paths: int,
+    months: int,
+    monthly_savings: float,
+    cash_savings: float,
+    purchase_price: float,
+    payoff_years: float,
+    rent_year: int,
+    block_months: int,
+    product: Products,
+) -> MonteCarloPaths:
+    assert n_paths > 0
+    assert months > 0
+    assert payoff_years >= 0
+
+    returns = block_bootstrap(joint_monthly_returns(product), n_paths, months, block_months, np.random.default_rng(seed))
+    growth = np.concatenate([np.ones((n_paths, 1, 2)), np.cumprod(returns[:, :-1], axis=1)], axis=1)
+    prices, rppi = growth[..., 0], growth[..., 1]
+
+    # synthetic years start at year 0, so no oekb report applies and the conservative tax estimate is used
+    calendar = np.broadcast_to(np.arange(months), (n_paths, months))
+    # rent follows the index, adjusted every january. on extreme paths it can outgrow the savings, the portfolio then pays the difference
+    rents = rent_adjusted(rent_year) * rppi[:, calendar[0] // 12 * 12]
+    _, annual_tax = product.value
+
+    equity = _simulate_equity_paths(prices, calendar, rents, np.full(n_paths, float(monthly_savings)), np.full(n_paths, float(cash_savings)), annual_tax)
+
+    # real estate: property once the mortgage is paid off, then invest the savings
+    owns_property = np.arange(months) / 12.0 >= payoff_years
+    real_estate = np.where(owns_property, purchase_price * rppi, 0.0)
+    payoff_months = int(payoff_years * 12 + 0.0001)
+    equity_monthly_savings = monthly_savings - _monthly_ownership_costs()
+    if payoff_months < months and equity_monthly_savings > 0:
+        real_estate[:, payoff_months:] += _simulate_equity_paths(prices[:, payoff_months:], calendar[:, payoff_months:], rents[:, payoff_months:], np.full(n_paths, equity_monthly_savings), np.zeros(n_paths), annual_tax)
+
+    assert equity.shape == real_estate.shape == (n_paths, months)
+    return MonteCarloPaths(equity=equity, real_estate=real_estate)
+
+
+def _simulate_results(chunk: tuple[int, np.random.SeedSequence, int], keep_paths: bool, dtype: type, **arguments) -> ScenarioResults:
+    # one chunk as a store, so only what is kept travels back from the worker
+    first_path, seed, n_paths = chunk
+    paths = _simulate_chunk(seed, n_paths, **arguments)
+    results = ScenarioResults(arguments["months"], dtype=dtype, keep_paths=keep_paths, strategies=MonteCarloPaths._fields)
+    results.add(paths._asdict(), path=np.arange(first_path, first_path + n_paths))
+    return results
+
+
+def run_monte_carlo(
+    n_paths: int,
+    years: int,
+    monthly_savings: float,
+    cash_savings: float,
+    purchase_price: float,
+    rent_year: int = 2024,
+    block_months: int = 12,
+    product: Products = Products.MSCI_WORLD,
+    seed: int = 0,
+    chunk_paths: int = 2_000,
+    max_workers: int | None = None,
+    keep_paths: bool = True,
+    dtype: type = np.float64,
+) -> ScenarioResults:
+    """
+    simulate both strategies over `n_paths` bootstrapped market histories
+
+    one scenario per path with the strategies "equity" and "real_estate", `keep_paths=False` keeps only the terminal values and float32 `dtype` halves the paths.
+    every chunk of paths gets its own child of `seed`, so results are reproducible regardless of the number of workers.
+    `rent_year` sets the rent level in the first month.
+    """
+    assert n_paths > 0 and years > 0
+    assert chunk_paths > 0
+    assert max_workers is None or max_workers > 0
+
+    months = years * 12
+    payoff_years = estimate_mortgage_payoff_years(monthly_savings, cash_savings, purchase_price)
+    starts = range(0, n_paths, chunk_paths)
+    seeds = np.random.SeedSequence(seed).spawn(len(starts))
+    simulate_results = partial(_simulate_results, keep_paths=keep_paths, dtype=dtype, months=months, monthly_savings=monthly_savings, cash_savings=cash_savings, purchase_price=purchase_price, payoff_years=payoff_years, rent_year=rent_year, block_months=block_months, product=product)
+    chunks = [(start, seeds[k], min(chunk_paths, n_paths - start)) for k, start in enumerate(starts)]
+
+    # parse the data once, forked workers then share the arrays copy-on-write
+    load_all()
+    results = ScenarioResults(months, dtype=dtype, keep_paths=keep_paths, strategies=MonteCarloPaths._fields)
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count() or 1, mp_context=multiprocessing.get_context("fork")) as executor:
+        for chunk in executor.map(simulate_results, chunks):
+            results.extend(chunk)
+
+    assert len(results) == n_paths
+    return results
+
+
+def _simulate_part(chunk: tuple[int, np.random.SeedSequence, int], keep_paths: bool, **arguments) -> pl.DataFrame:
+    df = _simulate_results(chunk, keep_paths, np.float64, **arguments).to_polars()
+    return df.with_columns((pl.col("equity") - pl.col("real_estate")).alias("spread"))
+
+
+def run_monte_carlo_checkpointed(
+    n_paths: int,
+    years: int,
+    monthly_savings: float,
+    cash_savings: float,
+    purchase_price: float,
+    out_dir: Path | str,
+    rent_year: int = 2024,
+    block_months: int = 12,
+    product: Products = Products.MSCI_WORLD,
+    seed: int = 0,
+    chunk_paths: int = 2_000,
+    max_workers: int | None = None,
+    keep_paths: bool = False,
+) -> pl.LazyFrame:
+    """
+    `run_monte_carlo` written chunk by chunk to `out_dir`, rerunning with the same arguments resumes where the last run stopped
+
+    one row per path with the terminal values of both strategies, `keep_paths` adds the monthly paths as array columns.
+    chunks use the same seeds as `run_monte_carlo`, so the results are identical.
+    """
+    assert n_paths > 0 and years > 0
+    assert chunk_paths > 0
+
+    months = years * 12
+    payoff_years = estimate_mortgage_payoff_years(monthly_savings, cash_savings, purchase_price)
+    starts = range(0, n_paths, chunk_paths)
+    seeds = np.random.SeedSequence(seed).spawn(len(starts))
+    simulate_part = partial(_simulate_part, keep_paths=keep_paths, months=months, monthly_savings=monthly_savings, cash_savings=cash_savings, purchase_price=purchase_price, payoff_years=payoff_years, rent_year=rent_year, block_months=block_months, product=product)
+
+    fingerprint = {"run": "monte_carlo", "n_paths": n_paths, "years": years, "monthly_savings": monthly_savings, "cash_savings": cash_savings, "purchase_price": purchase_price, "rent_year": rent_year, "block_months": block_months, "product": product, "seed": seed, "chunk_paths": chunk_paths, "keep_paths": keep_paths}
+    units = ((k, (start, seeds[k], min(chunk_paths, n_paths - start))) for k, start in enumerate(starts))
+    return run_checkpointed(Checkpoint(out_dir, fingerprint), simulate_part, units, len(starts), max_workers)
+
+
+if __name__ == "__main__":
+    INITIAL_LUMP_SUM = 130_000
+    PROPERTY_PRICE = 500_000
+    INCOME = IncomePercentile.pct_75th.value / 12
+    YEARS = int(estimate_mortgage_payoff_years(INCOME, INITIAL_LUMP_SUM, PROPERTY_PRICE)) + 10
+
+    results = run_monte_carlo(n_paths=10_000, years=YEARS, monthly_savings=INCOME, cash_savings=INITIAL_LUMP_SUM, purchase_price=PROPERTY_PRICE)
+    spread = results.final("equity") - results.final("real_estate")
+    print(f"equity wins in {(spread > 0).mean():.1%} of {len(spread)} paths")
+    print("terminal spread percentiles (5/25/50/75/95):", np.percentile(spread, [5, 25, 50, 75, 95]).round(0))
+
+    from plotting import PathReservoir, fan_chart_data, plot_fan_chart_ascii  # heavy imports, only when plotting
+
+    # same seed, so both reservoirs keep the same (paired) paths
+    bands = {}
+    for strategy, strategy_paths in (("Equity ETF", results.paths("equity")), ("Real Estate", results.paths("real_estate"))):
+        reservoir = PathReservoir(strategy_paths.shape[1])
+        reservoir.add(strategy_paths)
+        bands[strategy] = reservoir.bands()
+    plot_fan_chart_ascii(fan_chart_data(bands, first_month=month_index(2025, 1)))  # synthetic histories, dated from today
@@ -0,0 +1,194 @@
+"""
+plotting backends, kept out of `main` so headless runs never import plotnine, matplotlib or pandas
+
+single paths are thinned out with lttb before drawing, large path sets are drawn as fan charts of per-month quantile bands.
+either way the amount drawn is bounded, so plot time does not grow with the number of scenarios.
+"""
+
+from datetime import datetime
+
+import numpy as np
+import plotille
+import polars as pl
+from plotnine import aes, element_text, geom_line, geom_ribbon, geom_text, ggplot, labs, scale_x_date, scale_y_continuous, theme, theme_minimal
+
+from market_data import month_dates
+
+QUANTILES = (5, 25, 50, 75, 95)
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    indices of `threshold` points that preserve the visual shape of a line (largest triangle three buckets)
+
+    - https://skemman.is/bitstream/1946/15343/3/SS_MSthesis.pdf
+    """
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    assert x.shape == y.shape and x.ndim == 1
+    assert threshold >= 3
+    if len(x) <= threshold:
+        return np.arange(len(x))
+
+    # first and last point are always kept, the rest is split into equally sized buckets
+    edges = np.linspace(1, len(x) - 1, threshold - 1).astype(np.int64)
+    selected = [0]
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else len(x)
+        next_x, next_y = x[end:next_end].mean(), y[end:next_end].mean()
+
+        # keep the point spanning the largest triangle with the previous pick and the next bucket's average
+        a = selected[-1]
+        areas = np.abs((x[a] - next_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (next_y - y[a]))
+        selected.append(int(start + areas.argmax()))
+    selected.append(len(x) - 1)
+
+    indices = np.array(selected)
+    assert len(indices) == threshold
+    assert (np.diff(indices) > 0).all()
+    return indices
+
+
+def _downsample(df: pl.DataFrame, max_points: int) -> pl.DataFrame:
+    # per strategy, on a numeric time axis
+    parts = []
+    for _, data in df.group_by(["strategy"], maintain_order=True):
+        data = data.sort("date")
+        parts.append(data[lttb(data["date"].cast(pl.Int64).to_numpy(), data["payout"].to_numpy(), max_points)])
+    return pl.concat(parts)
+
+
+class PathReservoir:
+    """
+    uniform sample of at most `capacity` paths out of a stream of (paths, months) chunks
+
+    reservoir sampling keeps memory and plot time bounded however many paths are streamed in, quantile bands are read off the sample.
+    """
+
+    def __init__(self, months: int, capacity: int = 2_000, seed: int = 0):
+        assert months > 0 and capacity > 0
+        self.sample = np.empty((capacity, months))
+        self.seen = 0
+        self._rng = np.random.default_rng(seed)
+
+    def add(self, paths: np.ndarray) -> None:
+        paths = np.atleast_2d(paths)
+        assert paths.shape[1] == self.sample.shape[1]
+        capacity = len(self.sample)
+
+        # fill up first
+        fill = max(0, min(capacity - self.seen, len(paths)))
+        self.sample[self.seen : self.seen + fill] = paths[:fill]
+
+        # then path number t replaces a random slot with probability capacity / (t + 1), later paths win on collisions
+        slots = self._rng.integers(0, np.arange(self.seen + fill, self.seen + len(paths)) + 1)
+        keep = slots < capacity
+        slots, rows = slots[keep][::-1], np.flatnonzero(keep)[::-1] + fill
+        slots, first = np.unique(slots, return_index=True)
+        self.sample[slots] = paths[rows[first]]
+        self.seen += len(paths)
+
+    def bands(self, quantiles: tuple[int, ...] = QUANTILES) -> np.ndarray:
+        """
+        (quantiles, months) percentiles over the sampled paths
+        """
+        assert self.seen > 0, "no paths added"
+        result = np.percentile(self.sample[: min(self.seen, len(self.sample))], quantiles, axis=0)
+        assert result.shape == (len(quantiles), self.sample.shape[1])
+        return result
+
+
+def fan_chart_data(bands: dict[str, np.ndarray], first_month: int, quantiles: tuple[int, ...] = QUANTILES) -> pl.DataFrame:
+    """
+    long dataframe with one `p<q>` column per quantile, from (quantiles, months) bands per strategy
+    """
+    assert len(bands) > 0
+    frames = []
+    for strategy, values in bands.items():
+        assert values.shape[0] == len(quantiles)
+        frames.append(pl.DataFrame({"date": month_dates(first_month, values.shape[1]), "strategy": strategy} | {f"p{q}": values[k] for k, q in enumerate(quantiles)}))
+    return pl.concat(frames)
+
+
+def plot_fan_chart(df: pl.DataFrame):
+    assert {"p5", "p25", "p50", "p75", "p95"} <= set(df.columns)
+    p = (
+        ggplot(df, aes(x="date", fill="strategy"))
+        + geom_ribbon(aes(ymin="p5", ymax="p95"), alpha=0.15)
+        + geom_ribbon(aes(ymin="p25", ymax="p75"), alpha=0.3)
+        + geom_line(aes(y="p50", color="strategy"), size=1)
+        + theme_minimal()
+        + labs(title="Equity vs Real Estate Portfolio Value Over Time", subtitle="Median with 25-75% and 5-95% bands across scenarios", x="Date", y="Net Worth (EUR)", color="Strategy", fill="Strategy")
+        + theme(
+            figure_size=(10, 6),
+            axis_text_x=element_text(rotation=45, hjust=1),
+            plot_title=element_text(size=16, weight="bold"),
+            legend_position="bottom",
+        )
+        + scale_y_continuous(labels=lambda label: [f"{x:,.0f}€" for x in label])
+    )
+
+    p.save(f"assets/fan_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf")
+    p.show()
+
+
+def plot_fan_chart_ascii(df: pl.DataFrame):
+    fig = plotille.Figure()
+    fig.width = 80
+    fig.height = 30
+
+    for (name,), data in df.group_by(["strategy"], maintain_order=True):
+        data = data.sort("date")
+        x = data["date"].dt.year() + (data["date"].dt.month() - 1) / 12.0
+        for column in ("p5", "p50", "p95"):
+            fig.plot(x, data[column], label=f"{name} {column.upper()}")
+
+    print(fig.show(legend=True))
+
+
+def plot_comparison(df: pl.DataFrame, max_points: int = 500):
+    df = _downsample(df, max_points)
+    last_rows = df.group_by("strategy").last()
+
+    p = (
+        ggplot(df, aes(x="date", y="payout", color="strategy"))
+        + geom_line(size=1)
+        + geom_text(
+            last_rows,
+            aes(label="payout"),
+            va="bottom",
+            ha="right",
+            size=10,
+            format_string="{:,.0f}€",
+            nudge_y=20000,
+            show_legend=False,
+        )
+        + theme_minimal()
+        + labs(title="Equity vs Real Estate Portfolio Value Over Time", subtitle="Comparison of two strategies (initial lump sum + monthly savings)", x="Date", y="Net Worth (EUR)", color="Strategy")
+        + theme(
+            figure_size=(10, 6),
+            axis_text_x=element_text(rotation=45, hjust=1),
+            plot_title=element_text(size=16, weight="bold"),
+            legend_position="bottom",
+        )
+        + scale_y_continuous(labels=lambda label: [f"{x:,.0f}€" for x in label])
+        + scale_x_date(expand=(0.1, 0.1))
+    )
+
+    p.save(f"assets/comparison_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf")
+    p.show()
+
+
+def plot_comparison_ascii(df: pl.DataFrame):
+    fig = plotille.Figure()
+    fig.width = 80
+    fig.height = 30
+
+    df = _downsample(df, fig.width * 2)  # braille cells are 2 dots wide
+    for (name,), data in df.group_by(["strategy"]):
+        data = data.sort("date")
+        x = data["date"].dt.year() + (data["date"].dt.month() - 1) / 12.0
+        y = data["payout"]
+        fig.plot(x, y, label=str(name))
+
+    print(fig.show(legend=True))
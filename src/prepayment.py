@@ -0,0 +1,174 @@
+"""
+optimal mortgage paydown by dynamic programming
+
+every month the savings left after ownership costs and the regular payment can be prepaid (capped per month), invested in the etf side fund, or the side fund can pay off the loan early.
+backward induction over a discretised (debt, fund) grid finds the policy that maximizes terminal net wealth.
+the property is worth the same under every policy, so it is left out of the objective.
+
+simplifications: the fund grows at a constant expected return net of KESt, and the 6 month notice period of an early exit is charged as 6 more months of interest instead of being simulated.
+"""
+
+import time
+from typing import NamedTuple
+
+import numpy as np
+import polars as pl
+
+from equity import KEST, Products
+from income import IncomePercentile
+from market_data import msci_world_prices, vanguard_all_world_prices
+from real_estate import _monthly_mortgage_payment, _monthly_ownership_costs, _mortgage_terms, amortization_schedule
+
+ACTIONS = ("prepay", "invest", "exit")
+
+MAX_MONTHLY_PAYMENT = 10_000.0 / 12  # same cap as `amortization_schedule`
+EARLY_EXIT_NOTICE_MONTHS = 6
+EARLY_EXIT_PENALTY_RATE = 0.01
+
+
+class PrepaymentPlan(NamedTuple):
+    """
+    optimal policy, month by month, with the wealth it reaches and, for comparison, the wealth of the `amortization_schedule` policy in the same model
+    """
+
+    schedule: pl.DataFrame
+    terminal_wealth: float
+    heuristic_wealth: float
+    seconds: float
+
+
+def historical_return(product: Products = Products.MSCI_WORLD) -> float:
+    """
+    annualized return over the whole price history of `product`
+    """
+    _, prices = {Products.MSCI_WORLD: msci_world_prices, Products.VANGUARD_ALL_WORLD: vanguard_all_world_prices}[product]()
+    result = (prices[-1] / prices[0]) ** (12 / (len(prices) - 1)) - 1
+    assert -1 < result < 1
+    return float(result)
+
+
+def _step(debt: np.ndarray, fund: np.ndarray, action: int, rate: float, payment: float, available: float, growth: float) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    next (debt, fund) of one month under `action`, and whether the action is allowed
+    """
+    # regular payment while in debt, everything left goes to prepayment or the fund
+    interest = debt * rate / 12.0
+    regular = np.minimum(payment, debt + interest)
+    debt_after_regular = debt + interest - regular
+    excess = available - regular
+
+    if action == 0:  # prepay
+        prepaid = np.clip(np.minimum(excess, MAX_MONTHLY_PAYMENT), 0.0, debt_after_regular)
+        return debt_after_regular - prepaid, fund * growth + (excess - prepaid), np.ones(debt.shape, dtype=bool)
+    if action == 1:  # invest
+        return debt_after_regular, fund * growth + excess, np.ones(debt.shape, dtype=bool)
+
+    # exit: the fund pays the debt, the penalty and the interest during the notice period
+    exit_cost = debt * (1 + EARLY_EXIT_PENALTY_RATE) + EARLY_EXIT_NOTICE_MONTHS * interest
+    allowed = (debt > 0) & (fund >= exit_cost)
+    return np.zeros(debt.shape), (fund - np.where(allowed, exit_cost, 0.0)) * growth + available, allowed
+
+
+def _interpolation(grid: np.ndarray, values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # lower grid index and weight of the upper neighbour, clamped to the grid
+    values = np.clip(values, grid[0], grid[-1])
+    lower = np.clip(np.searchsorted(grid, values, side="right") - 1, 0, len(grid) - 2)
+    weight = (values - grid[lower]) / (grid[lower + 1] - grid[lower])
+    return lower, weight
+
+
+def _bilinear(value: np.ndarray, debt_index: tuple[np.ndarray, np.ndarray], fund_index: tuple[np.ndarray, np.ndarray]) -> np.ndarray:
+    (d, wd), (f, wf) = debt_index, fund_index
+    return (1 - wd) * ((1 - wf) * value[d, f] + wf * value[d, f + 1]) + wd * ((1 - wf) * value[d + 1, f] + wf * value[d + 1, f + 1])
+
+
+def optimize_prepayment(
+    mortgage_amount: float,
+    annual_interest_rate: float,
+    monthly_savings: float,
+    years: int,
+    annual_return: float | None = None,
+    debt_points: int = 121,
+    fund_points: int = 161,
+) -> PrepaymentPlan:
+    """
+    month by month choice between prepaying, investing and exiting early that maximizes fund minus debt after `years`
+
+    `annual_return` of the side fund defaults to the historical msci world return, KESt is deducted from it.
+    the transitions are the same every month, so grid indices and weights are computed once per action and reused by every backward step.
+    """
+    assert mortgage_amount > 0
+    assert 0 <= annual_interest_rate <= 1.0
+    assert years > 0
+    assert debt_points >= 2 and fund_points >= 2
+    start = time.perf_counter()
+
+    STANDARD_TERM_YEARS = 25
+    months = years * 12
+    payment = _monthly_mortgage_payment(mortgage_amount, annual_interest_rate, STANDARD_TERM_YEARS)
+    available = monthly_savings - _monthly_ownership_costs()
+    assert available >= payment, "insufficient monthly savings"
+    annual_return = historical_return() if annual_return is None else annual_return
+    growth = (1 + annual_return * (1 - KEST)) ** (1 / 12)
+
+    # the fund can never exceed every saving compounded over the whole horizon
+    debt_grid = np.linspace(0.0, mortgage_amount, debt_points)
+    fund_grid = np.linspace(0.0, available * months * max(growth, 1.0) ** months, fund_points)
+    debt, fund = np.meshgrid(debt_grid, fund_grid, indexing="ij")
+
+    # memoized transitions: (debt index, fund index, allowed) per action
+    transitions = []
+    for action in range(len(ACTIONS)):
+        next_debt, next_fund, allowed = _step(debt, fund, action, annual_interest_rate, payment, available, growth)
+        transitions.append((_interpolation(debt_grid, next_debt), _interpolation(fund_grid, next_fund), allowed))
+
+    # backward induction, values[t] is the best terminal wealth reachable from month t
+    values = np.empty((months + 1, debt_points, fund_points))
+    values[months] = fund - debt
+    for t in range(months - 1, -1, -1):
+        candidates = [np.where(allowed, _bilinear(values[t + 1], debt_index, fund_index), -np.inf) for debt_index, fund_index, allowed in transitions]
+        values[t] = np.max(candidates, axis=0)
+
+    # roll the policy forward from the actual state, off the grid
+    rows = []
+    state_debt, state_fund = np.array([mortgage_amount]), np.array([0.0])
+    for t in range(months):
+        outcomes = [_step(state_debt, state_fund, action, annual_interest_rate, payment, available, growth) for action in range(len(ACTIONS))]
+        scores = [_bilinear(values[t + 1], _interpolation(debt_grid, next_debt), _interpolation(fund_grid, next_fund))[0] if allowed[0] else -np.inf for next_debt, next_fund, allowed in outcomes]
+        action = int(np.argmax(scores)) if state_debt[0] > 0 else 1  # nothing left to decide once the debt is gone
+        state_debt, state_fund = outcomes[action][0], outcomes[action][1]
+        rows.append((t + 1, ACTIONS[action], float(state_debt[0]), float(state_fund[0])))
+
+    schedule = pl.DataFrame(rows, schema=["month", "action", "debt", "fund"], orient="row")
+    plan = PrepaymentPlan(schedule=schedule, terminal_wealth=float(state_fund[0] - state_debt[0]), heuristic_wealth=_heuristic_wealth(mortgage_amount, annual_interest_rate, monthly_savings, payment, available, growth, months), seconds=time.perf_counter() - start)
+    assert schedule.height == months
+    assert np.isfinite(plan.terminal_wealth)
+    return plan
+
+
+def _heuristic_wealth(mortgage_amount: float, rate: float, monthly_savings: float, payment: float, available: float, growth: float, months: int) -> float:
+    """
+    terminal wealth of the `amortization_schedule` policy: prepay up to the cap, keep the rest in the fund, exit when the schedule gives notice
+    """
+    schedule = amortization_schedule(mortgage_amount, rate, monthly_savings)
+    payoff_month = int(schedule.payoff_months[0])
+    # the schedule exits early if debt is left in its payoff month, notice was given at the end of the month 6 months before
+    exit_step = payoff_month - EARLY_EXIT_NOTICE_MONTHS if schedule.debt[0, payoff_month - 1] > 0 else months
+
+    # this model charges the notice period at once, if the fund does not cover that yet the exit follows as soon as it does
+    debt, fund = np.array([mortgage_amount]), np.array([0.0])
+    for t in range(months):
+        next_debt, next_fund, allowed = _step(debt, fund, 2, rate, payment, available, growth)
+        debt, fund = (next_debt, next_fund) if t >= exit_step and allowed[0] else _step(debt, fund, 0, rate, payment, available, growth)[:2]
+    return float(fund[0] - debt[0])
+
+
+if __name__ == "__main__":
+    INCOME = IncomePercentile.pct_75th.value / 12
+    mortgage_amount, annual_interest_rate = _mortgage_terms(500_000, 130_000)
+    plan = optimize_prepayment(mortgage_amount, annual_interest_rate, INCOME, years=20)
+
+    # consecutive months with the same action
+    runs = plan.schedule.with_columns((pl.col("action") != pl.col("action").shift()).fill_null(True).cum_sum().alias("run")).group_by("run", maintain_order=True).agg(pl.col("action").first(), pl.col("month").min().alias("from"), pl.col("month").max().alias("to"), pl.col("debt").last(), pl.col("fund").last())
+    print(runs.drop("run"))
+    print(f"terminal wealth {plan.terminal_wealth:,.0f} (heuristic {plan.heuristic_wealth:,.0f}), solved in {plan.seconds:.2f}s")
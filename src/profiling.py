@@ -0,0 +1,124 @@
+"""
+opt-in instrumentation of simulation runs
+
+records wall time per stage, call counts of hot functions, csv reads and cache hit rates, and reports them when the process exits.
+
+- `RENT_OR_BUY_PROFILE=table` (or `1`) prints a table to stderr
+- `RENT_OR_BUY_PROFILE=json` prints json to stderr
+- `RENT_OR_BUY_PROFILE=<path>.json` writes json to a file
+
+only the main process is recorded, pool workers exit without reporting.
+"""
+
+import atexit
+import functools
+import json
+import os
+import sys
+import time
+from collections import Counter, defaultdict
+from collections.abc import Callable
+from contextlib import contextmanager
+from pathlib import Path
+
+_mode = os.environ.get("RENT_OR_BUY_PROFILE", "")
+_stages: dict[str, float] = defaultdict(float)
+_calls: Counter = Counter()
+_io = {"csv_reads": 0, "csv_bytes": 0}
+_caches: dict[str, Callable[[], tuple[int, int]]] = {}
+
+
+def enabled() -> bool:
+    return _mode not in ("", "0", "off")
+
+
+def enable(mode: str = "table") -> None:
+    """
+    switch profiling on at runtime, e.g. from a command line flag
+    """
+    global _mode
+    assert mode not in ("", "0", "off")
+    _mode = mode
+    assert enabled()
+
+
+@contextmanager
+def stage(name: str):
+    """
+    add the wall time of the block to stage `name`
+    """
+    if not enabled():
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _stages[name] += time.perf_counter() - start
+
+
+def counted(function):
+    """
+    count calls of the decorated function
+    """
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if enabled():
+            _calls[function.__qualname__] += 1
+        return function(*args, **kwargs)
+
+    return wrapper
+
+
+def record_csv_read(path: Path) -> None:
+    if not enabled():
+        return
+    _io["csv_reads"] += 1
+    _io["csv_bytes"] += path.stat().st_size
+
+
+def watch_cache(name: str, hits_and_misses: Callable[[], tuple[int, int]]) -> None:
+    """
+    include a cache in the report, `hits_and_misses` is polled when reporting
+    """
+    assert name not in _caches, f"cache {name} registered twice"
+    _caches[name] = hits_and_misses
+
+
+def report() -> dict:
+    caches = {}
+    for name, hits_and_misses in _caches.items():
+        hits, misses = hits_and_misses()
+        caches[name] = {"hits": hits, "misses": misses, "hit_rate": hits / (hits + misses) if hits + misses else 0.0}
+
+    result = {"stages": dict(_stages), "calls": dict(_calls), "io": dict(_io), "caches": caches}
+    assert all(seconds >= 0 for seconds in result["stages"].values())
+    assert all(0.0 <= cache["hit_rate"] <= 1.0 for cache in caches.values())
+    return result
+
+
+def _format_table(result: dict) -> str:
+    lines = [f"{'stage':<40} {'seconds':>12}"]
+    lines += [f"{name:<40} {seconds:>12.4f}" for name, seconds in result["stages"].items()]
+    lines += ["", f"{'function':<40} {'calls':>12}"]
+    lines += [f"{name:<40} {calls:>12}" for name, calls in result["calls"].items()]
+    lines += ["", f"{'csv reads':<40} {result['io']['csv_reads']:>12}", f"{'csv bytes parsed':<40} {result['io']['csv_bytes']:>12}"]
+    lines += ["", f"{'cache':<40} {'hits':>12} {'misses':>8} {'hit rate':>9}"]
+    lines += [f"{name:<40} {cache['hits']:>12} {cache['misses']:>8} {cache['hit_rate']:>9.1%}" for name, cache in result["caches"].items()]
+    return "\n".join(lines)
+
+
+def _emit() -> None:
+    if not enabled():
+        return
+    result = report()
+    if _mode.endswith(".json"):
+        Path(_mode).write_text(json.dumps(result, indent=2) + "\n")
+    elif _mode == "json":
+        print(json.dumps(result, indent=2), file=sys.stderr)
+    else:
+        print(_format_table(result), file=sys.stderr)
+
+
+atexit.register(_emit)
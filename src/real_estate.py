@@ -1,11 +1,14 @@
-import datetime
+from collections.abc import Iterator
 from functools import cache
-from pathlib import Path
+from typing import Literal, NamedTuple
 
+import numpy as np
 import polars as pl
-from dateutil.relativedelta import relativedelta
 
-from equity import simulate_equity_portfolio
+from equity import Products, iter_equity_portfolio, simulate_equity_batch, simulate_equity_portfolio
+from market_data import load_rate_series, month_dates, month_index, rate_series_hash, rppi_at, rppi_first, rppi_last
+from profiling import counted, watch_cache
+from result_cache import disk_cache
 
 
 def _upfront_costs(purchase_price: float, mortgage_amount: float) -> float:
@@ -65,7 +68,7 @@ def _mortgage_amount(purchase_price: float, cash_savings: float) -> float:
     return mortgage
 
 
-def _interest_rate(down_payment_ratio: float) -> float:
+def _interest_rate(down_payment_ratio: float, base_rate: float = 0.034) -> float:
     """
     interest rate is better with higher down payment, better credit score
 
@@ -74,8 +77,9 @@ def _interest_rate(down_payment_ratio: float) -> float:
     - https://www.fma.gv.at/en/fma-issues-regulation-for-sustainable-lending-standards-for-residential-real-estate-financing-kim-v/
     """
     assert 0 <= down_payment_ratio <= 1.0
+    assert 0 <= base_rate <= 1.0
 
-    BASE_INTEREST_RATE = 0.034
+    BASE_INTEREST_RATE = base_rate
 
     if down_payment_ratio >= 0.40:
         return BASE_INTEREST_RATE - 0.005  # common discount (estimate)
@@ -87,7 +91,7 @@ def _interest_rate(down_payment_ratio: float) -> float:
         return BASE_INTEREST_RATE + 0.005  # common penalty (estimate)
 
 
-def _monthly_ownership_costs() -> float:
+def _monthly_ownership_costs(bk_rate: float = 2.60, reserve_rate: float = 1.12, tax_rate: float = 0.20, insurance_rate: float = 0.30) -> float:
     """
     property maintenance, regardless of mortgage
 
@@ -100,12 +104,14 @@ def _monthly_ownership_costs() -> float:
     """
     typical_apartment_size_m2 = 80.0
 
-    bk_rate = 2.60  # operating costs (betriebskosten)
-    reserve_rate = 1.12  # maintenance reserve (reparaturrücklage)
-    energy_rate = 2.50  # energy costs (heizkosten, warmwasser, strom)
-    insurance_rate = 0.30  # insurance costs (hausversicherung, haftpflicht, etc.)
-    energy_rate = 0.20  # tax costs (grundsteuer, etc.)
-    total_cost_per_m2 = bk_rate + reserve_rate + energy_rate + insurance_rate
+    # per m2 and month:
+    # bk_rate: operating costs (betriebskosten)
+    # reserve_rate: maintenance reserve (reparaturrücklage)
+    # tax_rate: tax costs (grundsteuer, etc.)
+    # insurance_rate: insurance costs (hausversicherung, haftpflicht, etc.)
+    # energy costs (heizkosten, warmwasser, strom, ~2.50) are not included
+    assert min(bk_rate, reserve_rate, tax_rate, insurance_rate) >= 0
+    total_cost_per_m2 = bk_rate + reserve_rate + tax_rate + insurance_rate
     return total_cost_per_m2 * typical_apartment_size_m2
 
 
@@ -134,13 +140,51 @@ def _monthly_mortgage_payment(principal: float, annual_rate: float, years: int)
     return principal * (monthly_rate * factor) / (factor - 1)
 
 
-def _simulate_payoff_years(
-    mortgage_amount: float,
-    annual_interest_rate: float,
-    monthly_savings: float,
-) -> float:
+class AmortizationSchedule(NamedTuple):
     """
-    simulate month-by-month payoff considering
+    month-by-month loan schedules of a batch of mortgages, shape (mortgages, months)
+
+    months after a mortgage's payoff are nan. `payoff_months` is the month the debt is gone, including the early-exit notice period.
+    """
+
+    debt: np.ndarray
+    interest: np.ndarray
+    principal: np.ndarray
+    extra_principal: np.ndarray
+    exit_fund: np.ndarray
+    payoff_months: np.ndarray
+
+
+def _regular_schedule_single(debt: float, annual_interest_rate: float, payment: float, extra_payment: float, excess_saved: float) -> tuple[list[np.ndarray], int, np.ndarray]:
+    # the regular loop of `amortization_schedule` for one loan with debt, as ((1, months) schedules, months, paid_off_month)
+    accumulated_savings = 0.0
+    columns = []
+    month = 0
+    while True:
+        month += 1
+        assert month <= 1000 * 12, "simulation did not converge"
+        interest = debt * annual_interest_rate / 12.0
+        principal = max(payment - interest, 0.0)
+        debt_after_regular = debt - principal
+        extra_principal = 0.0 if debt_after_regular <= 0 else min(extra_payment, debt_after_regular)
+        debt = debt_after_regular - extra_principal
+        paid_off = debt <= 0
+        accumulated_savings = accumulated_savings + (0.0 if paid_off else excess_saved)
+        columns.append((debt, interest, principal, extra_principal, accumulated_savings))
+        if paid_off:
+            return list(np.array(columns).T[:, None, :]), month, np.array([month])
+
+
+def amortization_schedule(
+    mortgage_amounts: float | np.ndarray,
+    annual_interest_rates: float | np.ndarray,
+    monthly_savings: float | np.ndarray,
+    ownership_costs: float | np.ndarray | None = None,
+) -> AmortizationSchedule:
+    """
+    simulate month-by-month payoff of many mortgages at once
+
+    `ownership_costs` are deducted from the savings every month, `_monthly_ownership_costs()` by default
 
     you can pay a 1% penalty (HIKrG § 20) to exit a fixed-rate mortgage early
 
@@ -149,9 +193,11 @@ def _simulate_payoff_years(
     - https://www.arbeiterkammer.at/beratung/konsument/Geld/Kredite/Vorzeitige-Rueckzahlung-von-Krediten.html
     - https://www.infina.at/ratgeber/kredit-vorzeitig-zurueckzahlen/
     """
-    assert mortgage_amount >= 0
-    assert 0 <= annual_interest_rate <= 1.0
-    assert monthly_savings > 0
+    ownership_costs = _monthly_ownership_costs() if ownership_costs is None else ownership_costs
+    mortgage_amounts, annual_interest_rates, monthly_savings, ownership_costs = np.broadcast_arrays(*map(np.atleast_1d, (mortgage_amounts, annual_interest_rates, monthly_savings, ownership_costs)))
+    assert (mortgage_amounts >= 0).all()
+    assert ((0 <= annual_interest_rates) & (annual_interest_rates <= 1.0)).all()
+    assert (monthly_savings > 0).all()
 
     STANDARD_TERM_YEARS = 25
     MAX_MONTHLY_PAYMENT = 10_000.0 / 12  # smoothed
@@ -160,67 +206,274 @@ def _simulate_payoff_years(
     EARLY_EXIT_PENALTY_RATE = 0.01
 
     # paid off immediately
-    if mortgage_amount <= 0:
-        return 0.0
+    has_debt = mortgage_amounts > 0
+    if not has_debt.any():
+        return AmortizationSchedule(*[np.empty((len(mortgage_amounts), 0))] * 5, payoff_months=np.zeros(len(mortgage_amounts), dtype=np.int64))
 
-    monthly_mortgage_payment = _monthly_mortgage_payment(mortgage_amount, annual_interest_rate, STANDARD_TERM_YEARS)
-    monthly_savings -= _monthly_ownership_costs()
-    assert monthly_savings >= monthly_mortgage_payment, "insufficient monthly savings"
+    monthly_mortgage_payment = np.array([_monthly_mortgage_payment(amount, rate, STANDARD_TERM_YEARS) if amount > 0 else 0.0 for amount, rate in zip(mortgage_amounts.tolist(), annual_interest_rates.tolist())])
+    monthly_savings = monthly_savings - ownership_costs
+    assert (monthly_savings[has_debt] >= monthly_mortgage_payment[has_debt]).all(), "insufficient monthly savings"
     monthly_excess = monthly_savings - monthly_mortgage_payment
+    extra_payment = np.minimum(monthly_excess, MAX_MONTHLY_PAYMENT)
+    excess_saved = np.maximum(0.0, monthly_excess - MAX_MONTHLY_PAYMENT)  # saved up for a potential early exit
+
+    #
+    # regular schedule, as if we never exit early
+    #
 
-    debt = mortgage_amount
-    accumulated_savings = 0.0  # for a potential early exit
+    debt = np.where(has_debt, mortgage_amounts, 0.0)
+    accumulated_savings = np.zeros(len(debt))
+    paid_off_month = np.where(has_debt, 0, -1)
+    columns = []
     month = 0
 
-    while debt > 0:
+    if len(debt) == 1:
+        # a single loan steps much faster on python floats than on 1-element arrays, same arithmetic
+        schedules, month, paid_off_month = _regular_schedule_single(float(debt[0]), float(annual_interest_rates[0]), float(monthly_mortgage_payment[0]), float(extra_payment[0]), float(excess_saved[0]))
+
+    while (paid_off_month == 0).any():
         month += 1
         assert month <= 1000 * 12, "simulation did not converge"
 
         # pay regular monthly payment
-        interest = debt * annual_interest_rate / 12.0
-        assert interest >= 0
-        principal = max(monthly_mortgage_payment - interest, 0.0)
-        debt -= principal
-        if debt <= 0:
-            break
+        interest = debt * annual_interest_rates / 12.0
+        principal = np.maximum(monthly_mortgage_payment - interest, 0.0)
+        debt_after_regular = debt - principal
+        paid_regular = debt_after_regular <= 0
 
         # pay whatever we still have available (capped)
-        extra_principal = min(monthly_excess, MAX_MONTHLY_PAYMENT, debt)
-        debt -= extra_principal
-        if debt <= 0:
-            break
+        extra_principal = np.where(paid_regular, 0.0, np.minimum(extra_payment, debt_after_regular))
+        debt = debt_after_regular - extra_principal
+        paid_off_month = np.where((paid_off_month == 0) & (debt <= 0), month, paid_off_month)
+        accumulated_savings = accumulated_savings + np.where(paid_off_month == 0, excess_saved, 0.0)
+        columns.append((debt, interest, principal, extra_principal, accumulated_savings))
 
-        # save the rest up for a potential early exit
-        excess_saved = max(0.0, monthly_excess - MAX_MONTHLY_PAYMENT)
-        accumulated_savings += excess_saved
+    if len(debt) > 1:
+        schedules = [np.stack(column, axis=1) for column in zip(*columns)]
+    debt_schedule, interest_schedule, principal_schedule, extra_schedule, exit_fund_schedule = schedules
 
-        #
-        # should we exit early?
-        #
+    #
+    # should we exit early? test every month at once
+    #
+
+    # simulate loan during notice period with continued payments
+    tmp_debt = debt_schedule
+    rate = annual_interest_rates[:, None] / 12.0
+    payment = monthly_mortgage_payment[:, None]
+    for _ in range(EARLY_EXIT_NOTICE_MONTHS):
+        temp_interest_month = tmp_debt * rate
+        temp_principal = np.maximum(payment - temp_interest_month, 0.0)
+        temp_extra = np.minimum(MAX_MONTHLY_PAYMENT, tmp_debt - temp_principal)
+        tmp_debt = np.where(tmp_debt > 0, tmp_debt - (temp_principal + temp_extra), tmp_debt)
+
+    penalty_cost = tmp_debt * EARLY_EXIT_PENALTY_RATE
+    total_cost_to_exit = tmp_debt + penalty_cost
+
+    # check if our saved lump sum covers the debt AND the penalty
+    projected_lump = exit_fund_schedule + EARLY_EXIT_NOTICE_MONTHS * excess_saved[:, None]
+    month_numbers = np.arange(1, debt_schedule.shape[1] + 1)
+    can_exit = (projected_lump >= total_cost_to_exit) & (month_numbers < paid_off_month[:, None])  # only while the loan is running
+    first_exit_month = np.where(can_exit.any(axis=1), can_exit.argmax(axis=1) + 1, month + 1)
+    payoff_months = np.where(first_exit_month < paid_off_month, first_exit_month + EARLY_EXIT_NOTICE_MONTHS, np.maximum(paid_off_month, 0))
+
+    # keep the regular schedule until the debt is gone
+    beyond_payoff = month_numbers > np.minimum(payoff_months, np.maximum(paid_off_month, 0))[:, None]
+    schedule = [np.where(beyond_payoff, np.nan, values) for values in (np.maximum(debt_schedule, 0.0), interest_schedule, principal_schedule, extra_schedule, exit_fund_schedule)]
+
+    assert payoff_months.shape == mortgage_amounts.shape
+    assert (payoff_months[~has_debt] == 0).all()
+    assert (payoff_months[has_debt] > 0).all()
+    return AmortizationSchedule(*schedule, payoff_months=payoff_months)
+
+
+def variable_rate_schedule(
+    mortgage_amounts: float | np.ndarray,
+    annual_rate_paths: np.ndarray,
+    monthly_savings: float | np.ndarray,
+    ownership_costs: float | np.ndarray | None = None,
+    refinance_months: tuple[int, ...] = (),
+    refinance_cost_rate: float = 0.01,
+) -> AmortizationSchedule:
+    """
+    month-by-month payoff of loans whose rate follows a path, one loan per row of `annual_rate_paths` (paths, months)
 
-        excess_per_month = max(0.0, monthly_excess - MAX_MONTHLY_PAYMENT)
-        projected_lump = accumulated_savings + EARLY_EXIT_NOTICE_MONTHS * excess_per_month
+    the annuity is recomputed over the remaining term whenever the rate changes, paths shorter than the loan hold their last rate.
+    at each of `refinance_months` (months since start) the remaining debt plus `refinance_cost_rate` is refinanced at the path's current rate, fixed from then on.
+    early repayment follows `amortization_schedule`: notice is given once the saved excess covers the debt projected over the notice period, the loan is repaid when it ends.
+    repaying is free while the rate is variable (HIKrG § 20) and costs 1% once it is fixed, a shortfall of the fund (e.g. after a rate rise) is paid from savings.
+    the savings must cover the first payment, later rate rises may push the payment above them: it is made anyway, consumers can check for shortfalls.
+    """
+    annual_rate_paths = np.atleast_2d(np.asarray(annual_rate_paths, dtype=np.float64))
+    ownership_costs = _monthly_ownership_costs() if ownership_costs is None else ownership_costs
+    mortgage_amounts, monthly_savings, ownership_costs = np.broadcast_arrays(*(np.broadcast_to(np.asarray(values, dtype=np.float64), (len(annual_rate_paths),)) for values in (mortgage_amounts, monthly_savings, ownership_costs)))
+    assert (mortgage_amounts >= 0).all()
+    assert ((0 <= annual_rate_paths) & (annual_rate_paths <= 1.0)).all()
+    assert annual_rate_paths.shape[1] > 0
+    assert all(month > 0 for month in refinance_months)
+
+    STANDARD_TERM_MONTHS = 25 * 12
+    MAX_MONTHLY_PAYMENT = 10_000.0 / 12  # smoothed
+    EARLY_EXIT_NOTICE_MONTHS = 6
+    EARLY_EXIT_PENALTY_RATE = 0.01
 
-        # simulate loan during notice period with continued payments
-        tmp_debt = debt
-        tmp_interest = 0.0
+    def annuity(principal: np.ndarray, annual_rate: np.ndarray, months: int) -> np.ndarray:
+        # vectorized `_monthly_mortgage_payment`
+        monthly_rate = annual_rate / 12.0
+        factor = (1 + monthly_rate) ** months
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(annual_rate <= 1e-9, principal / months, principal * (monthly_rate * factor) / (factor - 1))
+
+    rate_at = lambda month: annual_rate_paths[:, min(month, annual_rate_paths.shape[1]) - 1]
+
+    debt = mortgage_amounts.copy()
+    exit_fund = np.zeros(len(debt))
+    paid_off_month = np.where(debt > 0, 0, -1)
+    is_fixed = np.zeros(len(debt), dtype=bool)
+    fixed_rate = np.zeros(len(debt))
+    rate = rate_at(1)
+    payment = annuity(debt, rate, STANDARD_TERM_MONTHS)
+    assert (monthly_savings - ownership_costs >= payment)[debt > 0].all(), "insufficient monthly savings"
+    notice_month = np.zeros(len(debt), dtype=np.int64)  # month notice was given, 0 without notice
+    columns = []
+    month = 0
+
+    while (paid_off_month == 0).any():
+        month += 1
+        assert month <= 1000 * 12, "simulation did not converge"
+        active = paid_off_month == 0
+
+        # refinance into a fixed rate
+        reset = np.zeros(len(debt), dtype=bool)
+        if month - 1 in refinance_months:
+            debt = np.where(active, debt * (1 + refinance_cost_rate), debt)
+            fixed_rate = np.where(active, rate_at(month), fixed_rate)
+            is_fixed = is_fixed | active
+            reset = active
+
+        # rate reset: same remaining term, new annuity
+        new_rate = np.where(is_fixed, fixed_rate, rate_at(month))
+        reset = reset | (new_rate != rate)
+        rate = new_rate
+        if reset.any():
+            payment = np.where(reset, annuity(debt, rate, max(STANDARD_TERM_MONTHS - month + 1, 1)), payment)
+
+        # pay regular monthly payment, then whatever we still have available (capped)
+        interest = debt * rate / 12.0
+        principal = np.maximum(payment - interest, 0.0)
+        debt_after_regular = debt - principal
+        monthly_excess = monthly_savings - ownership_costs - payment
+        extra_payment = np.clip(monthly_excess, 0.0, MAX_MONTHLY_PAYMENT)
+        excess_saved = np.maximum(0.0, monthly_excess - MAX_MONTHLY_PAYMENT)
+        extra_principal = np.where(debt_after_regular <= 0, 0.0, np.minimum(extra_payment, debt_after_regular))
+        new_debt = debt_after_regular - extra_principal
+        new_fund = exit_fund + excess_saved
+
+        # repay early when the notice period ends, like `amortization_schedule` even if the projection below fell short of the fund
+        penalty_rate = np.where(is_fixed, EARLY_EXIT_PENALTY_RATE, 0.0)
+        exits = active & (notice_month > 0) & (month - notice_month >= EARLY_EXIT_NOTICE_MONTHS) & (new_debt > 0)
+        new_fund = np.where(exits, np.maximum(new_fund - new_debt * (1 + penalty_rate), 0.0), new_fund)
+        extra_principal = np.where(exits, extra_principal + new_debt, extra_principal)
+        new_debt = np.where(exits, 0.0, new_debt)
+
+        # give notice once the saved excess covers the debt left after the notice period, projected at the current rate
+        projected_debt = new_debt
         for _ in range(EARLY_EXIT_NOTICE_MONTHS):
-            if tmp_debt <= 0:
-                break
-            temp_interest_month = tmp_debt * annual_interest_rate / 12.0
-            tmp_interest += temp_interest_month
-            temp_principal = max(monthly_mortgage_payment - temp_interest_month, 0.0)
-            temp_extra = min(MAX_MONTHLY_PAYMENT, tmp_debt - temp_principal)
-            tmp_debt -= temp_principal + temp_extra
+            projected_principal = np.maximum(payment - projected_debt * rate / 12.0, 0.0)
+            projected_extra = np.minimum(MAX_MONTHLY_PAYMENT, projected_debt - projected_principal)
+            projected_debt = np.where(projected_debt > 0, projected_debt - (projected_principal + projected_extra), projected_debt)
+        projected_fund = new_fund + EARLY_EXIT_NOTICE_MONTHS * excess_saved
+        notice = active & (notice_month == 0) & (new_debt > 0) & (projected_fund >= projected_debt * (1 + penalty_rate))
+        notice_month = np.where(notice, month, notice_month)
+
+        debt = np.where(active, new_debt, debt)
+        exit_fund = np.where(active, new_fund, exit_fund)
+        paid_off_month = np.where(active & (debt <= 0), month, paid_off_month)
+        columns.append([np.where(active, values, np.nan) for values in (np.maximum(debt, 0.0), interest, principal, extra_principal, exit_fund)])
+
+    schedule = [np.stack(column, axis=1) for column in zip(*columns)] if columns else [np.empty((len(debt), 0))] * 5
+    payoff_months = np.maximum(paid_off_month, 0)
+    assert payoff_months.shape == mortgage_amounts.shape
+    assert (payoff_months[mortgage_amounts > 0] > 0).all()
+    return AmortizationSchedule(*schedule, payoff_months=payoff_months)
+
+
+def historical_rate_paths(series: tuple[int, np.ndarray], start_months: np.ndarray, months: int, margin: float = 0.0) -> np.ndarray:
+    """
+    (starts, months) annual rate paths cut from a monthly reference rate series (e.g. `load_rate_series`), plus a bank margin
+
+    every path starts at one of `start_months` (`month_index`), months after the end of the series hold its last value.
+    """
+    first_month, rates = series
+    start_months = np.atleast_1d(start_months)
+    assert months > 0
+    assert (start_months >= first_month).all() and (start_months < first_month + len(rates)).all(), "start outside the rate series"
+
+    offsets = np.minimum(start_months[:, None] - first_month + np.arange(months), len(rates) - 1)
+    paths = rates[offsets] + margin
+    assert paths.shape == (len(start_months), months)
+    return paths
+
+
+class VariableRate(NamedTuple):
+    """
+    variable rate mortgage following a monthly reference rate (e.g. 3M Euribor) from a csv read by `market_data.load_rate_series`
+
+    the loan pays the reference rate plus `margin`, adjusted for the down payment like the fixed rate (`_interest_rate`) and floored at zero.
+    at each of `refinance_months` (months since purchase) the remaining debt is refinanced at that month's rate, fixed from then on.
+    """
+
+    series: str
+    margin: float = 0.015
+    refinance_months: tuple[int, ...] = ()
+
+    def cache_key(self) -> tuple:
+        # the contents of the csv, not just its path, key cached results and checkpoints
+        return (*self, rate_series_hash(self.series))
+
 
-        penalty_cost = tmp_debt * EARLY_EXIT_PENALTY_RATE
-        total_cost_to_exit = tmp_debt + penalty_cost
+def _variable_rate_mortgage(monthly_savings: float, cash_savings: float, purchase_price: float, start: int, variable_rate: VariableRate) -> AmortizationSchedule:
+    """
+    mortgage schedule under the reference rates from month `start` (`month_index`) on, see `variable_rate_schedule`
+    """
+    assert purchase_price + _upfront_costs(purchase_price, 0.0) - cash_savings > 0, "bought outright, no mortgage"
+    STANDARD_TERM_MONTHS = 25 * 12
+
+    mortgage_amount, margin = _mortgage_terms(purchase_price, cash_savings, base_rate=variable_rate.margin)
+    rates = historical_rate_paths(load_rate_series(variable_rate.series), np.array([start]), STANDARD_TERM_MONTHS, margin=margin)
+    schedule = variable_rate_schedule(mortgage_amount, np.maximum(rates, 0.0), monthly_savings, refinance_months=variable_rate.refinance_months)
+    assert schedule.payoff_months.shape == (1,)
+    return schedule
+
+
+@cache
+def _simulate_payoff_years(
+    mortgage_amount: float,
+    annual_interest_rate: float,
+    monthly_savings: float,
+) -> float:
+    """
+    simulate month-by-month payoff of a single mortgage, see `amortization_schedule`
+    """
+    assert mortgage_amount >= 0
+    assert 0 <= annual_interest_rate <= 1.0
+    assert monthly_savings > 0
 
-        # check if our saved lump sum covers the debt AND the penalty
-        if projected_lump >= total_cost_to_exit:
-            return (month + EARLY_EXIT_NOTICE_MONTHS) / 12.0
+    payoff_months = amortization_schedule(mortgage_amount, annual_interest_rate, monthly_savings).payoff_months
+    assert payoff_months.shape == (1,)
+    return int(payoff_months[0]) / 12.0
 
-    return month / 12.0
+
+watch_cache("real_estate._simulate_payoff_years", lambda: _simulate_payoff_years.cache_info()[:2])
+
+
+def _mortgage_terms(purchase_price: float, cash_savings: float, base_rate: float = 0.034) -> tuple[float, float]:
+    mortgage_amount = _mortgage_amount(purchase_price, cash_savings)
+    upfront = _upfront_costs(purchase_price, mortgage_amount)
+    down_payment = cash_savings - upfront
+    down_payment_ratio = down_payment / purchase_price
+    annual_interest_rate = _interest_rate(down_payment_ratio, base_rate)
+    assert mortgage_amount >= 0
+    return mortgage_amount, annual_interest_rate
 
 
 def estimate_mortgage_payoff_years(
@@ -242,80 +495,96 @@ def estimate_mortgage_payoff_years(
         return 0.0
 
     # simulate mortgage payoff
-    mortgage_amount = _mortgage_amount(purchase_price, cash_savings)
-    upfront = _upfront_costs(purchase_price, mortgage_amount)
-    down_payment = cash_savings - upfront
-    down_payment_ratio = down_payment / purchase_price
-    annual_interest_rate = _interest_rate(down_payment_ratio)
+    mortgage_amount, annual_interest_rate = _mortgage_terms(purchase_price, cash_savings)
     payoff_years = _simulate_payoff_years(mortgage_amount, annual_interest_rate, monthly_savings)
     return payoff_years
 
 
-@cache
+def payoff_months_batch(
+    monthly_savings: float | np.ndarray,
+    cash_savings: float | np.ndarray,
+    purchase_price: float | np.ndarray,
+) -> np.ndarray:
+    """
+    vectorized `estimate_mortgage_payoff_years`, in months, arguments broadcast against each other
+    """
+    monthly_savings, cash_savings, purchase_price = (array.astype(np.float64) for array in np.broadcast_arrays(*map(np.atleast_1d, (monthly_savings, cash_savings, purchase_price))))
+    assert (monthly_savings > 0).all()
+    assert (cash_savings >= 0).all()
+    assert (purchase_price > 0).all()
+
+    # mortgage terms follow scalar rules (rate tiers, commission brackets), buying outright leaves no mortgage
+    mortgage_amounts = np.zeros(len(monthly_savings))
+    interest_rates = np.zeros(len(monthly_savings))
+    for k, (price, cash) in enumerate(zip(purchase_price.tolist(), cash_savings.tolist())):
+        if price + _upfront_costs(price, 0.0) - cash > 0:
+            mortgage_amounts[k], interest_rates[k] = _mortgage_terms(price, cash)
+
+    payoff_months = amortization_schedule(mortgage_amounts, interest_rates, monthly_savings).payoff_months
+    assert payoff_months.shape == monthly_savings.shape
+    return payoff_months
+
+
+@counted
 def _estimate_real_estate_value(purchase_price: float, purchase_year: int, current_year: int) -> float:
     """
     estimate the inflation-adjusted value
     """
     assert 0 < purchase_price
     assert 0 < purchase_year < 2026
+    assert purchase_year <= current_year
 
-    datapath = Path(__file__).parent.parent / "data" / "rppi.csv"
-    value_increase = (
-        pl.read_csv(datapath)
-        # track price changes
-        .filter(pl.col("period") == "quarter")
-        .filter(pl.col("indicator") == "Real estate price index, Vienna, apartments total, 2000=100")
-        # filter year
-        .select(pl.col("year"), pl.col("quarter"), pl.col("values"))
-        .filter((pl.col("year") >= int(purchase_year)) & (pl.col("year") <= int(current_year)))
-        # compute ratio
-        .select(pl.col("values").last() / pl.col("values").first())
-        .item()
-    )
+    value_increase = rppi_last(current_year) / rppi_first(purchase_year)
     return purchase_price * value_increase
 
 
+@disk_cache
 def simulate_real_estate_portfolio(
     monthly_savings: float,
     years: int,
     start_year: int,
     purchase_price: float,
     cash_savings: float,
+    start_month: int = 1,
+    valuation: Literal["monthly", "annual"] = "monthly",
+    variable_rate: VariableRate | None = None,
 ) -> pl.DataFrame:
     """
     simulate the net worth (liquidation value) of a real estate investment over time
+
+    `valuation` "monthly" follows the interpolated rppi month by month, "annual" reprices once per calendar year (old behaviour)
+    `variable_rate` replaces the fixed rate mortgage by one that follows historical reference rates from the start month on
     """
     assert monthly_savings > 0
     assert years > 0
     assert 1900 <= start_year <= 2100
+    assert 1 <= start_month <= 12
     assert purchase_price > 0
     assert cash_savings >= 0
+    assert valuation in ("monthly", "annual"), f"unknown valuation {valuation}"
 
-    payoff_years = estimate_mortgage_payoff_years(monthly_savings, cash_savings, purchase_price)
-
-    dates = []
-    payout_history = []
-    start_date = datetime.date(start_year, 1, 1)
-
-    current_year_value = 0.0
-
+    start = month_index(start_year, start_month)
     total_months = years * 12
 
+    payoff_years = estimate_mortgage_payoff_years(monthly_savings, cash_savings, purchase_price)
+    if variable_rate is not None and payoff_years > 0:
+        payoff_years = int(_variable_rate_mortgage(monthly_savings, cash_savings, purchase_price, start, variable_rate).payoff_months[0]) / 12.0
+
     #
     # invest in equity after mortgage is paid off
     #
 
-    equity_payouts = [0.0] * total_months
+    equity_payouts = np.zeros(total_months)
     payoff_months = int(payoff_years * 12 + 0.0001)
 
     equity_months = total_months - payoff_months
     equity_monthly_savings = monthly_savings - _monthly_ownership_costs()
 
     if equity_months > 0 and equity_monthly_savings > 0:
-        start_equity_date = start_date + relativedelta(months=payoff_months)
+        start_equity = start + payoff_months
 
-        equity_df = simulate_equity_portfolio(monthly_savings=equity_monthly_savings, years=years, start_year=start_equity_date.year, start_month=start_equity_date.month, months=equity_months, cash_savings=0.0)  # not used for duration if months is set
-        equity_values = equity_df["payout"].to_list()
+        equity_df = simulate_equity_portfolio(monthly_savings=equity_monthly_savings, years=years, start_year=start_equity // 12, start_month=start_equity % 12 + 1, months=equity_months, cash_savings=0.0)  # not used for duration if months is set
+        equity_values = equity_df["payout"].to_numpy()
         assert len(equity_values) == equity_months
         equity_payouts[payoff_months:] = equity_values
 
@@ -323,17 +592,132 @@ def simulate_real_estate_portfolio(
     # pay off mortgage
     #
 
-    for i in range(total_months):
-        current_date = start_date + relativedelta(months=i)
-        dates.append(current_date)
+    # in debt until mortgage is paid off
+    owned = np.arange(total_months) / 12.0 >= payoff_years
+    if valuation == "monthly":
+        property_values = np.where(owned, purchase_price * (rppi_at(start + np.arange(total_months)) / rppi_at(start)), 0.0)
+    else:
+        calendar_years = ((start + np.arange(total_months)) // 12).tolist()
+        value_by_year = {year: _estimate_real_estate_value(purchase_price, start_year, year) for year in sorted(set(np.array(calendar_years)[owned].tolist()))}
+        property_values = np.array([value_by_year[year] if is_owned else 0.0 for year, is_owned in zip(calendar_years, owned.tolist())])
+
+    payout_history = property_values + equity_payouts
+    assert payout_history.shape == (total_months,)
+    return pl.DataFrame({"date": month_dates(start, total_months), "payout": payout_history})
+
+
+def simulate_real_estate_batch(
+    monthly_savings: float | np.ndarray,
+    start_year: int | np.ndarray,
+    start_month: int | np.ndarray,
+    months: int | np.ndarray,
+    purchase_price: float | np.ndarray,
+    cash_savings: float | np.ndarray,
+) -> np.ndarray:
+    """
+    vectorized `simulate_real_estate_portfolio` (monthly valuation) over many scenarios at once
 
-        # in debt until mortgage is paid off
-        if (i / 12.0) < payoff_years:
-            current_year_value = 0.0
-        else:
-            current_year_value = _estimate_real_estate_value(purchase_price, start_year, current_date.year)
+    arguments broadcast against each other, one scenario per element.
+    returns the payouts as a (scenarios, months) matrix, padded with nan after each scenario's horizon.
+    """
+    monthly_savings, start_year, start_month, months, purchase_price, cash_savings = np.broadcast_arrays(*map(np.atleast_1d, (monthly_savings, start_year, start_month, months, purchase_price, cash_savings)))
+    monthly_savings, purchase_price, cash_savings = (array.astype(np.float64) for array in (monthly_savings, purchase_price, cash_savings))
+    months = months.astype(np.int64)
+    assert ((1900 <= start_year) & (start_year <= 2100)).all()
+    assert ((1 <= start_month) & (start_month <= 12)).all()
+    assert (months > 0).all()
+
+    start = start_year.astype(np.int64) * 12 + start_month.astype(np.int64) - 1
+    payoff_months = payoff_months_batch(monthly_savings, cash_savings, purchase_price)
+    columns = np.arange(months.max())
+
+    # invest in equity after the mortgage is paid off, shifted into place
+    equity_payouts = np.zeros((len(start), len(columns)))
+    equity_months = months - payoff_months
+    equity_monthly_savings = monthly_savings - _monthly_ownership_costs()
+    invests = (equity_months > 0) & (equity_monthly_savings > 0)
+    if invests.any():
+        equity_start = start[invests] + payoff_months[invests]
+        paths = simulate_equity_batch(equity_monthly_savings[invests], equity_start // 12, equity_start % 12 + 1, equity_months[invests], 0.0, Products.MSCI_WORLD)
+        offsets = columns - payoff_months[invests][:, None]
+        inside = (offsets >= 0) & (offsets < equity_months[invests][:, None])
+        equity_payouts[invests] = np.where(inside, paths[np.arange(len(paths))[:, None], np.clip(offsets, 0, paths.shape[1] - 1)], 0.0)
+
+    # in debt until mortgage is paid off
+    owned = columns >= payoff_months[:, None]
+    property_values = np.where(owned, purchase_price[:, None] * (rppi_at(start[:, None] + columns) / rppi_at(start)[:, None]), 0.0)
+
+    payouts = np.where(columns < months[:, None], property_values + equity_payouts, np.nan)
+    assert payouts.shape == (len(start), months.max())
+    return payouts
+
+
+class RealEstateMonth(NamedTuple):
+    """
+    state of the real estate strategy at the end of a month
+    """
+
+    month: int  # `month_index`
+    debt: float  # outstanding mortgage
+    property_value: float  # zero while in debt
+    equity_value: float  # savings invested after the payoff
+    payout: float
+
+
+def iter_real_estate_portfolio(
+    monthly_savings: float,
+    years: int,
+    start_year: int,
+    purchase_price: float,
+    cash_savings: float,
+    start_month: int = 1,
+    valuation: Literal["monthly", "annual"] = "monthly",
+    variable_rate: VariableRate | None = None,
+) -> Iterator[RealEstateMonth]:
+    """
+    month-by-month `simulate_real_estate_portfolio` including the mortgage schedule, stop consuming whenever you like
+    """
+    assert monthly_savings > 0
+    assert years > 0
+    assert 1900 <= start_year <= 2100
+    assert 1 <= start_month <= 12
+    assert purchase_price > 0
+    assert cash_savings >= 0
+    assert valuation in ("monthly", "annual"), f"unknown valuation {valuation}"
+
+    start = month_index(start_year, start_month)
+    total_months = years * 12
 
-        total_value = current_year_value + equity_payouts[i]
-        payout_history.append(total_value)
+    payoff_years = estimate_mortgage_payoff_years(monthly_savings, cash_savings, purchase_price)
+    debt = np.zeros(0)
+    if payoff_years > 0 and variable_rate is not None:
+        schedule = _variable_rate_mortgage(monthly_savings, cash_savings, purchase_price, start, variable_rate)
+        payoff_years = int(schedule.payoff_months[0]) / 12.0
+        debt = schedule.debt[0, : int(schedule.payoff_months[0])]
+    elif payoff_years > 0:
+        mortgage_amount, annual_interest_rate = _mortgage_terms(purchase_price, cash_savings)
+        debt = amortization_schedule(mortgage_amount, annual_interest_rate, monthly_savings).debt[0, : int(payoff_years * 12 + 0.0001)]
+    payoff_months = int(payoff_years * 12 + 0.0001)
+    equity_monthly_savings = monthly_savings - _monthly_ownership_costs()
+
+    # the equity side portfolio is only simulated once it starts
+    equity_states = iter(())
+    value_by_year = {}
 
-    return pl.DataFrame({"date": dates, "payout": payout_history})
+    for i in range(total_months):
+        month = start + i
+
+        if i == payoff_months and equity_monthly_savings > 0:
+            equity_states = iter_equity_portfolio(monthly_savings=equity_monthly_savings, years=years, start_year=month // 12, start_month=month % 12 + 1, months=total_months - payoff_months, cash_savings=0.0)
+        equity_value = next(equity_states).payout if i >= payoff_months and equity_monthly_savings > 0 else 0.0
+
+        # in debt until mortgage is paid off
+        property_value = 0.0
+        if (i / 12.0) >= payoff_years and valuation == "monthly":
+            property_value = purchase_price * (rppi_at(month) / rppi_at(start))
+        elif (i / 12.0) >= payoff_years:
+            if month // 12 not in value_by_year:
+                value_by_year[month // 12] = _estimate_real_estate_value(purchase_price, start_year, month // 12)
+            property_value = value_by_year[month // 12]
+
+        yield RealEstateMonth(month=month, debt=float(debt[i]) if i < len(debt) else 0.0, property_value=property_value, equity_value=equity_value, payout=property_value + equity_value)
@@ -0,0 +1,167 @@
+"""
+persistent on-disk cache for simulation results
+
+results are stored as parquet files, keyed by the call arguments plus a content hash of `data/*.csv` and `src/*.py`,
+so new market data or model changes never serve stale results. least recently used files are evicted beyond a size limit.
+
+- `RENT_OR_BUY_CACHE=on` enables the cache, it is off by default so batch runs do not leave thousands of files behind
+- `RENT_OR_BUY_CACHE_DIR` moves it (default: `.cache/results` in the repository)
+- `RENT_OR_BUY_CACHE_MAX_BYTES` bounds its size (default: 256 MiB)
+"""
+
+import functools
+import hashlib
+import inspect
+import os
+import uuid
+from enum import Enum
+from functools import cache
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+
+from profiling import watch_cache
+
+REPO_DIR = Path(__file__).parent.parent
+CACHE_DIR = Path(os.environ.get("RENT_OR_BUY_CACHE_DIR", REPO_DIR / ".cache" / "results"))
+MAX_BYTES = int(os.environ.get("RENT_OR_BUY_CACHE_MAX_BYTES", str(256 * 1024**2)))
+
+_stats = {"hits": 0, "misses": 0}
+_size = {"bytes": None}  # cache size as seen by this process, scanned once and then tracked
+
+
+@cache
+def content_hash() -> str:
+    """
+    hash of `data/*.csv` and `src/*.py`, changes with the market data or the model
+    """
+    sources = sorted((REPO_DIR / "data").glob("*.csv")) + sorted((REPO_DIR / "src").glob("*.py"))
+    assert len(sources) > 0
+    digest = hashlib.sha256()
+    for path in sources:
+        digest.update(path.name.encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def stable_repr(value: object) -> str:
+    """
+    repr that is equal for equal arguments across processes and runs, the basis of cache and checkpoint keys
+
+    values with a `cache_key()` method are represented by its result, e.g. to cover the contents of a file they name.
+    """
+    if callable(getattr(value, "cache_key", None)):
+        return stable_repr(value.cache_key())
+    # numpy scalars hit the same entry as the python value
+    if isinstance(value, np.generic):
+        value = value.item()
+    # enum values hold functions whose repr contains memory addresses
+    if isinstance(value, Enum):
+        return f"{type(value).__name__}.{value.name}"
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return repr(float(value))
+    if isinstance(value, dict):
+        return "{" + ", ".join(f"{stable_repr(key)}: {stable_repr(item)}" for key, item in value.items()) + "}"
+    if isinstance(value, (list, tuple)):
+        return "[" + ", ".join(stable_repr(item) for item in value) + "]"
+    return repr(value)
+
+
+def _scan() -> list[tuple[float, int, Path]]:
+    # (mtime, size, path) of all entries, skipping files other processes evict meanwhile
+    entries = []
+    for path in CACHE_DIR.glob("*.parquet"):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    return entries
+
+
+def _evict(written: int) -> None:
+    # rescan only once the tracked size exceeds the limit, then evict down to 3/4 of it so rescans stay rare
+    if _size["bytes"] is None:
+        _size["bytes"] = sum(size for _, size, _ in _scan())
+    else:
+        _size["bytes"] += written
+    if _size["bytes"] <= MAX_BYTES:
+        return
+
+    entries = sorted(_scan())
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in entries:
+        if total <= MAX_BYTES * 3 // 4:
+            break
+        path.unlink(missing_ok=True)
+        total -= size
+    _size["bytes"] = total
+    assert total <= MAX_BYTES or not entries
+
+
+def disk_cache(function):
+    """
+    cache a function returning a `pl.DataFrame` on disk if `RENT_OR_BUY_CACHE=on`
+
+    `.cached` uses the disk regardless of the variable, `.__wrapped__` never does.
+    """
+    signature = inspect.signature(function)
+    assert signature.return_annotation is pl.DataFrame, "only dataframes are cached"
+
+    def cached(*args, **kwargs) -> pl.DataFrame:
+        call = signature.bind(*args, **kwargs)
+        call.apply_defaults()
+        arguments = ", ".join(f"{name}={stable_repr(value)}" for name, value in call.arguments.items())
+        key = hashlib.sha256(f"{function.__module__}.{function.__qualname__}({arguments}) {content_hash()}".encode()).hexdigest()
+        path = CACHE_DIR / f"{key}.parquet"
+
+        # another process may evict the entry between any two calls, that is just a miss
+        try:
+            os.utime(path)  # mark as recently used
+            df = pl.read_parquet(path)
+            _stats["hits"] += 1
+            return df
+        except FileNotFoundError:
+            pass
+
+        _stats["misses"] += 1
+        df = function(*args, **kwargs)
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        partial_path = CACHE_DIR / f".{key}.{uuid.uuid4().hex}.tmp"
+        df.write_parquet(partial_path)
+        written = partial_path.stat().st_size
+        os.replace(partial_path, path)  # atomic, concurrent workers never read half-written files
+        _evict(written)
+        return df
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs) -> pl.DataFrame:
+        if os.environ.get("RENT_OR_BUY_CACHE", "off") != "on":
+            return function(*args, **kwargs)
+        return cached(*args, **kwargs)
+
+    wrapper.cached = cached
+    return wrapper
+
+
+watch_cache("result_cache (disk)", lambda: (_stats["hits"], _stats["misses"]))
+
+
+def cache_stats() -> dict[str, float]:
+    """
+    hit/miss counters of this process
+    """
+    lookups = _stats["hits"] + _stats["misses"]
+    result = {"hits": _stats["hits"], "misses": _stats["misses"], "hit_rate": _stats["hits"] / lookups if lookups else 0.0}
+    assert 0.0 <= result["hit_rate"] <= 1.0
+    assert result["hits"] >= 0 and result["misses"] >= 0
+    return result
+
+
+def clear_cache() -> None:
+    for path in CACHE_DIR.glob("*.parquet"):
+        path.unlink(missing_ok=True)
+    _stats.update(hits=0, misses=0)
+    _size["bytes"] = None
+    assert not any(CACHE_DIR.glob("*.parquet"))
@@ -0,0 +1,160 @@
+"""
+compact columnar store for many simulated scenarios
+
+one shared month axis, a (scenarios, months) payout matrix per strategy in float64 or float32 and per-scenario summary columns.
+with `keep_paths=False` only the summary (and each scenario's final payout per strategy) is kept.
+summaries and paths are exposed to polars and arrow without copying.
+"""
+
+import numpy as np
+import polars as pl
+import pyarrow as pa
+
+from market_data import month_dates
+
+
+class ScenarioResults:
+    """
+    append-only container for scenario paths on a common month axis
+
+    `strategies` names the payout matrices, e.g. ("equity", "real_estate") for paired runs.
+    `first_month` dates the axis (`month_index`), None for scenarios with different start dates whose axis is months since start.
+    """
+
+    def __init__(self, months: int, first_month: int | None = None, dtype: type = np.float64, keep_paths: bool = True, strategies: tuple[str, ...] = ("payout",)):
+        assert months > 0
+        assert np.dtype(dtype) in (np.float64, np.float32), "paths are stored as float64 or float32"
+        assert len(strategies) > 0 and len(set(strategies)) == len(strategies)
+        self.months = months
+        self.first_month = first_month
+        self.keep_paths = keep_paths
+        self.strategies = tuple(strategies)
+        self._size = 0
+        self._paths = {strategy: np.empty((0, months if keep_paths else 0), dtype=dtype) for strategy in self.strategies}
+        self._final = {strategy: np.empty(0) for strategy in self.strategies}
+        self._columns: dict[str, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _strategy(self, strategy: str | None) -> str:
+        assert strategy is not None or len(self.strategies) == 1, f"name one of {self.strategies}"
+        strategy = self.strategies[0] if strategy is None else strategy
+        assert strategy in self.strategies, f"unknown strategy {strategy}, expected one of {self.strategies}"
+        return strategy
+
+    def _reserve(self, size: int) -> None:
+        # grow geometrically, appends stay amortized O(1)
+        capacity = len(self._final[self.strategies[0]])
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity, 64)
+        grow = lambda values: np.concatenate([values[: self._size], np.empty((capacity - self._size, *values.shape[1:]), dtype=values.dtype)])
+        self._paths = {strategy: grow(values) for strategy, values in self._paths.items()}
+        self._final = {strategy: grow(values) for strategy, values in self._final.items()}
+        self._columns = {name: grow(values) for name, values in self._columns.items()}
+        assert len(self._final[self.strategies[0]]) == capacity
+
+    def _append_columns(self, summary: dict, n: int) -> None:
+        assert self._size == 0 or set(summary) == set(self._columns), f"summary columns {sorted(summary)} differ from {sorted(self._columns)}"
+        assert not set(summary) & set(self.strategies), "summary columns can not be named like a strategy"
+        capacity = len(self._final[self.strategies[0]])
+        for name, values in summary.items():
+            values = np.broadcast_to(np.asarray(values), (n,))
+            if name not in self._columns:
+                self._columns[name] = np.empty(capacity, dtype=values.dtype if values.dtype.kind in "biuf" else object)
+            self._columns[name][self._size : self._size + n] = values
+
+    def add(self, payouts: np.ndarray | dict[str, np.ndarray], **summary) -> None:
+        """
+        append (scenarios, months) payouts per strategy, nan after a shorter horizon, and scalar or per-scenario summary values
+
+        a store with a single strategy also takes the bare matrix.
+        """
+        payouts = payouts if isinstance(payouts, dict) else {self._strategy(None): payouts}
+        assert set(payouts) == set(self.strategies), f"expected payouts of {self.strategies}, got {sorted(payouts)}"
+        payouts = {strategy: np.atleast_2d(np.asarray(values, dtype=np.float64)) for strategy, values in payouts.items()}
+        n = len(payouts[self.strategies[0]])
+        assert all(values.shape == (n, self.months) for values in payouts.values()), f"expected {n} scenarios of {self.months} months for every strategy"
+
+        self._reserve(self._size + n)
+        for strategy, values in payouts.items():
+            if self.keep_paths:
+                self._paths[strategy][self._size : self._size + n] = values
+            # last payout before any nan padding
+            last = self.months - 1 - np.isfinite(values)[:, ::-1].argmax(axis=1)
+            self._final[strategy][self._size : self._size + n] = values[np.arange(n), last]
+        self._append_columns(summary, n)
+        self._size += n
+
+    def extend(self, other: "ScenarioResults") -> None:
+        """
+        append every scenario of another store with the same layout, e.g. one built by a worker
+        """
+        assert (other.months, other.keep_paths, other.strategies) == (self.months, self.keep_paths, self.strategies), "stores differ in months, keep_paths or strategies"
+        n = len(other)
+        if n == 0:
+            return
+        self._reserve(self._size + n)
+        for strategy in self.strategies:
+            if self.keep_paths:
+                self._paths[strategy][self._size : self._size + n] = other._paths[strategy][:n]
+            self._final[strategy][self._size : self._size + n] = other._final[strategy][:n]
+        self._append_columns({name: values[:n] for name, values in other._columns.items()}, n)
+        self._size += n
+
+    def paths(self, strategy: str | None = None) -> np.ndarray:
+        """
+        (scenarios, months) read-only view
+        """
+        assert self.keep_paths, "created with keep_paths=False"
+        view = self._paths[self._strategy(strategy)][: self._size]
+        view.flags.writeable = False
+        return view
+
+    def final(self, strategy: str | None = None) -> np.ndarray:
+        view = self._final[self._strategy(strategy)][: self._size]
+        view.flags.writeable = False
+        return view
+
+    @property
+    def nbytes(self) -> int:
+        return sum(self._paths[strategy][: self._size].nbytes + self.final(strategy).nbytes for strategy in self.strategies) + sum(values[: self._size].nbytes for values in self._columns.values())
+
+    def month_axis(self) -> pl.Series:
+        if self.first_month is None:
+            return pl.Series("month", np.arange(self.months))
+        return month_dates(self.first_month, self.months).alias("date")
+
+    def summary(self) -> pl.DataFrame:
+        """
+        one row per scenario: the summary columns and the final payout of each strategy, numeric columns share memory with the store
+        """
+        # object columns (strings, None) go through lists so polars infers their type
+        df = pl.DataFrame({name: values[: self._size] if values.dtype != object else values[: self._size].tolist() for name, values in self._columns.items()} | {strategy: self.final(strategy) for strategy in self.strategies})
+        assert df.height == self._size
+        return df
+
+    def to_arrow(self) -> pa.Table:
+        """
+        summary plus a fixed-size list column `<strategy>_path` per strategy, numeric buffers are not copied
+        """
+        table = self.summary().to_arrow()
+        if self.keep_paths:
+            for strategy in self.strategies:
+                flat = pa.array(self.paths(strategy).reshape(-1))
+                table = table.append_column(f"{strategy}_path", pa.FixedSizeListArray.from_arrays(flat, self.months))
+        assert table.num_rows == self._size
+        return table
+
+    def to_polars(self) -> pl.DataFrame:
+        return pl.from_arrow(self.to_arrow())
+
+    def long(self) -> pl.DataFrame:
+        """
+        scenario, month and the payout of each strategy per row, e.g. for plotting. this one copies
+        """
+        axis = self.month_axis()
+        df = pl.DataFrame({"scenario": np.repeat(np.arange(self._size), self.months), axis.name: pl.concat([axis] * self._size) if self._size else axis.clear()} | {strategy: self.paths(strategy).reshape(-1) for strategy in self.strategies})
+        assert df.height == self._size * self.months
+        return df
@@ -0,0 +1,160 @@
+"""
+sensitivity of the terminal wealth gap (real estate minus equity) to every model input
+
+all perturbed scenarios run as one batch through the vectorized engines, central differences then give a ranked tornado table.
+"""
+
+import numpy as np
+import polars as pl
+
+from equity import KEST, SPREAD_HALF, Products, simulate_equity_batch
+from income import IncomePercentile
+from market_data import rppi_at
+from real_estate import _monthly_ownership_costs, _mortgage_terms, _upfront_costs, amortization_schedule
+
+# input -> (step, relative). inputs are moved by ± step, relative steps are a fraction of the base value
+STEPS = {
+    "monthly_savings": (0.01, True),
+    "cash_savings": (0.01, True),
+    "purchase_price": (0.01, True),
+    "base_interest_rate": (0.0025, False),
+    "bk_rate": (0.10, True),
+    "reserve_rate": (0.10, True),
+    "tax_rate": (0.10, True),
+    "insurance_rate": (0.10, True),
+    "spread_half": (0.10, True),
+    "kest": (0.01, False),
+    "start_month": (1, False),
+}
+
+
+def terminal_gaps(
+    monthly_savings: np.ndarray,
+    cash_savings: np.ndarray,
+    purchase_price: np.ndarray,
+    base_interest_rate: np.ndarray,
+    bk_rate: np.ndarray,
+    reserve_rate: np.ndarray,
+    tax_rate: np.ndarray,
+    insurance_rate: np.ndarray,
+    spread_half: np.ndarray,
+    kest: np.ndarray,
+    start_month: np.ndarray,
+    years: int,
+    start_year: int,
+    product: Products = Products.MSCI_WORLD,
+) -> np.ndarray:
+    """
+    real estate minus equity terminal wealth of a batch of scenarios, arguments broadcast against each other
+
+    same model as `simulate_real_estate_portfolio` and `simulate_equity_portfolio` (monthly valuation), `start_month` may leave 1..12 to shift the start year.
+    """
+    arrays = np.broadcast_arrays(*map(np.atleast_1d, (monthly_savings, cash_savings, purchase_price, base_interest_rate, bk_rate, reserve_rate, tax_rate, insurance_rate, spread_half, kest, start_month)))
+    monthly_savings, cash_savings, purchase_price, base_interest_rate, bk_rate, reserve_rate, tax_rate, insurance_rate, spread_half, kest = (array.astype(np.float64) for array in arrays[:-1])
+    assert years > 0
+    assert (purchase_price > 0).all()
+    assert (cash_savings >= 0).all()
+
+    start = start_year * 12 + arrays[-1].astype(np.int64) - 1
+    total_months = years * 12
+
+    # rent and invest
+    equity = simulate_equity_batch(monthly_savings, start // 12, start % 12 + 1, total_months, cash_savings, product, spread_half, kest)[:, -1]
+
+    # buy: mortgage terms follow scalar rules (rate tiers, commission brackets)
+    ownership_costs = np.array([_monthly_ownership_costs(*rates) for rates in zip(bk_rate.tolist(), reserve_rate.tolist(), tax_rate.tolist(), insurance_rate.tolist())])
+    mortgage_amounts = np.zeros(len(start))
+    interest_rates = np.zeros(len(start))
+    for k, (price, cash, base_rate) in enumerate(zip(purchase_price.tolist(), cash_savings.tolist(), base_interest_rate.tolist())):
+        if price + _upfront_costs(price, 0.0) - cash > 0:
+            mortgage_amounts[k], interest_rates[k] = _mortgage_terms(price, cash, base_rate)
+    payoff_months = amortization_schedule(mortgage_amounts, interest_rates, monthly_savings, ownership_costs).payoff_months
+
+    # invest the savings once the mortgage is paid off, same product as `simulate_real_estate_portfolio`
+    equity_monthly_savings = monthly_savings - ownership_costs
+    invests = (payoff_months < total_months) & (equity_monthly_savings > 0)
+    equity_after_payoff = np.zeros(len(start))
+    if invests.any():
+        equity_start = start[invests] + payoff_months[invests]
+        equity_months = total_months - payoff_months[invests]
+        payouts = simulate_equity_batch(equity_monthly_savings[invests], equity_start // 12, equity_start % 12 + 1, equity_months, 0.0, Products.MSCI_WORLD, spread_half[invests], kest[invests])
+        equity_after_payoff[invests] = payouts[np.arange(len(equity_months)), equity_months - 1]
+
+    owned = (total_months - 1) / 12.0 >= payoff_months / 12.0
+    property_value = np.where(owned, purchase_price * (rppi_at(start + total_months - 1) / rppi_at(start)), 0.0)
+
+    gaps = (property_value + equity_after_payoff) - equity
+    assert gaps.shape == start.shape
+    assert np.isfinite(gaps).all()
+    return gaps
+
+
+def sensitivity(
+    monthly_savings: float,
+    cash_savings: float,
+    purchase_price: float,
+    years: int,
+    start_year: int,
+    start_month: int = 1,
+    product: Products = Products.MSCI_WORLD,
+) -> pl.DataFrame:
+    """
+    tornado table: terminal gap with each input moved down and up by its step, ranked by swing
+
+    `derivative` is the central difference, gap change per unit of the input.
+    """
+    assert monthly_savings > 0
+    assert 1 <= start_month <= 12
+
+    base = {
+        "monthly_savings": monthly_savings,
+        "cash_savings": cash_savings,
+        "purchase_price": purchase_price,
+        "base_interest_rate": 0.034,
+        "bk_rate": 2.60,
+        "reserve_rate": 1.12,
+        "tax_rate": 0.20,
+        "insurance_rate": 0.30,
+        "spread_half": SPREAD_HALF,
+        "kest": KEST,
+        "start_month": start_month,
+    }
+    assert set(base) == set(STEPS)
+    steps = {name: step * abs(base[name]) if relative else step for name, (step, relative) in STEPS.items()}
+
+    # row 0 is the base scenario, rows 2k+1 and 2k+2 move input k down and up
+    names = list(STEPS)
+    columns = {name: np.full(2 * len(names) + 1, base[name], dtype=np.float64) for name in names}
+    for k, name in enumerate(names):
+        columns[name][2 * k + 1] -= steps[name]
+        columns[name][2 * k + 2] += steps[name]
+    gaps = terminal_gaps(**columns, years=years, start_year=start_year, product=product)
+
+    gap_low, gap_high = gaps[1::2], gaps[2::2]
+    step = np.array([steps[name] for name in names])
+    df = pl.DataFrame(
+        {
+            "input": names,
+            "value": [float(base[name]) for name in names],
+            "step": step,
+            "gap_base": np.full(len(names), gaps[0]),
+            "gap_low": gap_low,
+            "gap_high": gap_high,
+            "derivative": (gap_high - gap_low) / (2 * step),
+            "swing": np.abs(gap_high - gap_low),
+        }
+    ).sort("swing", descending=True)
+    assert df.height == len(STEPS)
+    return df
+
+
+if __name__ == "__main__":
+    df = sensitivity(monthly_savings=IncomePercentile.pct_75th.value / 12, cash_savings=130_000, purchase_price=500_000, years=17, start_year=1994)
+    print(f"gap (real estate - equity) at base: {df['gap_base'][0]:,.0f}")
+
+    # tornado: bars from the base gap to the gap at the low and high end
+    widest = df["swing"].max()
+    for name, low, high, base_gap in df.select("input", "gap_low", "gap_high", "gap_base").iter_rows():
+        left = round(20 * max(base_gap - min(low, high), 0) / widest)
+        right = round(20 * max(max(low, high) - base_gap, 0) / widest)
+        print(f"{name:<20} {' ' * (20 - left)}{'█' * left}|{'█' * right}{' ' * (20 - right)} {low - base_gap:>+12,.0f} {high - base_gap:>+12,.0f}")
@@ -0,0 +1,359 @@
+"""
+local http/json service around the simulators
+
+keeps market data and caches warm across requests, evaluates on a pool of forked workers and coalesces concurrent requests into batches.
+stdlib only, listens on localhost or a unix socket.
+
+    POST /equity       arguments of `simulate_equity_portfolio`, `product` by name
+    POST /real_estate  arguments of `simulate_real_estate_portfolio`
+    POST /payoff       arguments of `estimate_mortgage_payoff_years`
+    GET  /metrics      request latency percentiles and batching stats
+
+    python service.py --port 8750
+    curl -s localhost:8750/payoff -d '{"monthly_savings": 6175, "cash_savings": 130000, "purchase_price": 500000}'
+"""
+
+import argparse
+import asyncio
+import inspect
+import json
+import logging
+import math
+import multiprocessing
+import os
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from types import UnionType
+from typing import Literal, Union, get_args, get_origin
+
+import numpy as np
+import polars as pl
+
+from equity import Products, simulate_equity_batch, simulate_equity_portfolio
+from market_data import load_all, month_dates
+from real_estate import estimate_mortgage_payoff_years, payoff_months_batch, simulate_real_estate_batch, simulate_real_estate_portfolio
+
+ENDPOINTS = {
+    "/equity": simulate_equity_portfolio,
+    "/real_estate": simulate_real_estate_portfolio,
+    "/payoff": estimate_mortgage_payoff_years,
+}
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 422: "Unprocessable Entity", 500: "Internal Server Error"}
+MODEL_ERRORS = (AssertionError, ValueError, TypeError)  # how the simulators reject a scenario, anything else is a bug
+
+log = logging.getLogger("service")
+
+
+def _json_result(result: pl.DataFrame | float) -> dict:
+    if isinstance(result, pl.DataFrame):
+        return result.with_columns(pl.col("date").cast(pl.String)).to_dict(as_series=False)
+    return {"payoff_years": result}
+
+
+@lru_cache(maxsize=4096)
+def _evaluate(endpoint: str, arguments: tuple, disk_cache: bool = False) -> tuple[int, dict]:
+    # scenarios the model rejects are a client error, anything else propagates and is logged by the server
+    arguments = dict(arguments)
+    function = getattr(ENDPOINTS[endpoint], "cached" if disk_cache else "__wrapped__", ENDPOINTS[endpoint])
+    try:
+        result = function(**(arguments | ({"product": Products[arguments["product"]]} if "product" in arguments else {})))
+    except MODEL_ERRORS as e:
+        return 422, {"error": str(e) or type(e).__name__}
+    return 200, _json_result(result)
+
+
+_results: dict[tuple[str, tuple], tuple[int, dict]] = {}  # vectorized results in worker memory, oldest dropped first
+MAX_RESULTS = 4096
+MIN_GROUP = 4  # smaller groups are faster through the scalar simulators
+
+
+def _evaluate_group(endpoint: str, calls: list[dict]) -> list[tuple[int, dict]]:
+    """
+    one vectorized engine call for all requests of a group, see `_group`
+    """
+    column = lambda name, default=None: np.array([call.get(name, default) for call in calls])
+
+    if endpoint == "/payoff":
+        payoff_years = payoff_months_batch(column("monthly_savings"), column("cash_savings"), column("purchase_price")) / 12.0
+        return [(200, {"payoff_years": float(years)}) for years in payoff_years]
+
+    months = column("years") * 12
+    start = column("start_year") * 12 + column("start_month", 1) - 1
+    if endpoint == "/equity":
+        months = np.array([call["months"] if call.get("months") is not None else call["years"] * 12 for call in calls])
+        payouts = simulate_equity_batch(column("monthly_savings"), start // 12, start % 12 + 1, months, column("cash_savings", 0.0), Products[calls[0].get("product", "MSCI_WORLD")])
+    else:
+        payouts = simulate_real_estate_batch(column("monthly_savings"), start // 12, start % 12 + 1, months, column("purchase_price"), column("cash_savings"))
+
+    # same dates for every request with the same start and horizon
+    dates = {key: month_dates(*key).cast(pl.String).to_list() for key in set(zip(start.tolist(), months.tolist()))}
+    return [(200, {"date": dates[first, count], "payout": row[:count].tolist()}) for row, first, count in zip(payouts, start.tolist(), months.tolist())]
+
+
+def _group(endpoint: str, arguments: dict) -> tuple | None:
+    # requests sharing a group run through one vectorized call, None: evaluated on its own
+    if endpoint == "/equity":
+        return (endpoint, arguments.get("product", "MSCI_WORLD"))
+    if endpoint == "/real_estate" and arguments.get("valuation", "monthly") == "monthly":
+        return (endpoint,)
+    if endpoint == "/payoff":
+        return (endpoint,)
+    return None
+
+
+def _evaluate_batch(batch: list[tuple[str, tuple]], disk_cache: bool = False) -> list[tuple[int, dict]]:
+    """
+    results of a batch of requests, in order
+
+    with the disk cache every request goes through the cached simulators. otherwise requests are grouped and each group of at least `MIN_GROUP` is one vectorized call.
+    a group with a scenario the model rejects is split until that request runs on its own, so only it fails.
+    """
+    assert len(batch) > 0
+    results: list[tuple[int, dict] | None] = [None] * len(batch)
+
+    groups: dict[tuple, list[int]] = {}
+    for k, (endpoint, arguments) in enumerate(batch):
+        group = None if disk_cache else _group(endpoint, dict(arguments))
+        if (endpoint, arguments) in _results:
+            results[k] = _results[endpoint, arguments]
+        elif group is None:
+            results[k] = _evaluate(endpoint, arguments, disk_cache)
+        else:
+            groups.setdefault(group, []).append(k)
+
+    def evaluate_isolating(endpoint: str, indices: list[int]) -> None:
+        # a failing group is split in halves until the failing requests run on their own
+        try:
+            group_results = _evaluate_group(endpoint, [dict(batch[k][1]) for k in indices])
+        except MODEL_ERRORS:
+            if len(indices) == 1:
+                group_results = [_evaluate(endpoint, batch[indices[0]][1], disk_cache)]
+            else:
+                evaluate_isolating(endpoint, indices[: len(indices) // 2])
+                evaluate_isolating(endpoint, indices[len(indices) // 2 :])
+                return
+        for k, result in zip(indices, group_results):
+            results[k] = _results[batch[k]] = result
+
+    for (endpoint, *_), indices in groups.items():
+        if len(indices) >= MIN_GROUP:
+            evaluate_isolating(endpoint, indices)
+            continue
+        for k in indices:
+            results[k] = _evaluate(endpoint, batch[k][1], disk_cache)
+    while len(_results) > MAX_RESULTS:
+        del _results[next(iter(_results))]
+
+    assert all(result is not None for result in results)
+    return results
+
+
+def _coerce(function, arguments: dict) -> dict:
+    """
+    arguments converted to the annotated types of `function`, products stay names. raises TypeError or ValueError
+    """
+    parameters = inspect.signature(function).parameters
+    coerced = {}
+    for name, value in arguments.items():
+        annotation = parameters[name].annotation
+        options = get_args(annotation) if get_origin(annotation) in (Union, UnionType, Literal) else (annotation,)
+        if value is None and type(None) in options:
+            coerced[name] = None
+        elif get_origin(annotation) is Literal:
+            if value not in options:
+                raise ValueError(f"{name} must be one of {list(options)}")
+            coerced[name] = value
+        elif Products in options:
+            if value not in Products.__members__:
+                raise ValueError(f"unknown product {value}, expected one of {list(Products.__members__)}")
+            coerced[name] = value
+        elif int in options and float not in options:
+            if isinstance(value, bool) or not (isinstance(value, int) or (isinstance(value, float) and value.is_integer())):
+                raise TypeError(f"{name} must be an integer, got {value!r}")
+            coerced[name] = int(value)
+        elif float in options:
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+                raise TypeError(f"{name} must be a finite number, got {value!r}")
+            coerced[name] = float(value)
+        else:
+            raise TypeError(f"{name} cannot be set through the service")
+    return coerced
+
+
+class ScenarioService:
+    """
+    request batching, worker pool and latency bookkeeping
+
+    while a worker is idle requests are dispatched right away (together with whatever arrived in the same event loop turn).
+    once all workers are busy, requests arriving within `batch_window` seconds are evaluated together, split across the workers.
+    identical concurrent requests are evaluated once, results stay cached in worker memory.
+    the disk cache is off unless `disk_cache` is set, writing parquet files costs more than most evaluations and it rules out vectorized batches.
+    """
+
+    def __init__(self, max_workers: int | None = None, batch_window: float = 0.002, max_batch: int = 256, disk_cache: bool = False):
+        assert max_workers is None or max_workers > 0
+        assert batch_window >= 0
+        assert max_batch > 0
+
+        # parse the data once, forked workers then share the arrays copy-on-write
+        load_all()
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context("fork"))
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.disk_cache = disk_cache
+
+        self._running = 0  # chunks submitted to the workers and not yet finished
+        self._pending: dict[tuple[str, tuple], asyncio.Future] = {}
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self._latencies: dict[str, deque] = defaultdict(lambda: deque(maxlen=10_000))
+        self._stats = {"requests": 0, "coalesced": 0, "batches": 0, "batched_scenarios": 0}
+
+    def warm_up(self) -> None:
+        # start the workers now instead of on the first request
+        assert all(future.result() is None for future in [self.executor.submit(load_all) for _ in range(self.max_workers)])
+
+    async def evaluate(self, endpoint: str, arguments: dict) -> tuple[int, dict]:
+        key = (endpoint, tuple(sorted(arguments.items())))
+        if key in self._pending:
+            self._stats["coalesced"] += 1
+            return await asyncio.shield(self._pending[key])
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            delay = 0.0 if self._running < self.max_workers else self.batch_window
+            self._flush_handle = asyncio.get_running_loop().call_later(delay, self._flush)
+        return await asyncio.shield(future)
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, {}
+        if not batch:
+            return
+
+        self._stats["batches"] += 1
+        self._stats["batched_scenarios"] += len(batch)
+        keys = list(batch)
+        chunk_size = -(-len(keys) // self.max_workers)
+        for i in range(0, len(keys), chunk_size):
+            self._running += 1
+            asyncio.ensure_future(self._run_chunk(keys[i : i + chunk_size], [batch[key] for key in keys[i : i + chunk_size]]))
+
+    async def _run_chunk(self, keys: list[tuple[str, tuple]], futures: list[asyncio.Future]) -> None:
+        # a chunk that fails on a bug fails all of its requests, `serve_connection` logs it
+        chunk = asyncio.get_running_loop().run_in_executor(self.executor, _evaluate_batch, keys, self.disk_cache)
+        await asyncio.wait([chunk])
+        self._running -= 1
+        for k, future in enumerate(futures):
+            if future.done():
+                continue
+            if chunk.exception() is not None:
+                future.set_exception(chunk.exception())
+            else:
+                future.set_result(chunk.result()[k])
+
+    def record(self, endpoint: str, seconds: float) -> None:
+        self._stats["requests"] += 1
+        self._latencies[endpoint].append(seconds)
+
+    def metrics(self) -> dict:
+        latencies = {}
+        for endpoint, seconds in self._latencies.items():
+            milliseconds = np.array(seconds) * 1e3
+            p50, p95, p99 = np.percentile(milliseconds, [50, 95, 99])
+            latencies[endpoint] = {"count": len(milliseconds), "mean_ms": float(milliseconds.mean()), "p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99), "max_ms": float(milliseconds.max())}
+
+        result = self._stats | {"workers": self.max_workers, "mean_batch_size": self._stats["batched_scenarios"] / self._stats["batches"] if self._stats["batches"] else 0.0, "latency": latencies}
+        assert result["mean_batch_size"] >= 0
+        assert all(endpoint["p50_ms"] <= endpoint["max_ms"] for endpoint in latencies.values())
+        return result
+
+    async def handle(self, method: str, path: str, body: bytes) -> tuple[int, dict]:
+        if method == "GET" and path == "/metrics":
+            return 200, self.metrics()
+        if path not in ENDPOINTS:
+            return 404, {"error": f"unknown endpoint {path}, expected one of {sorted(ENDPOINTS)} or /metrics"}
+        if method != "POST":
+            return 400, {"error": f"{path} expects POST"}
+
+        # reject malformed requests here, workers only see valid calls
+        try:
+            arguments = json.loads(body or b"{}")
+            assert isinstance(arguments, dict), "expected a json object"
+            inspect.signature(ENDPOINTS[path]).bind(**arguments)
+            arguments = _coerce(ENDPOINTS[path], arguments)
+        except (ValueError, TypeError, AssertionError) as e:
+            return 400, {"error": str(e)}
+        return await self.evaluate(path, arguments)
+
+    async def serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        # minimal http/1.1 with keep-alive
+        try:
+            while request_line := await reader.readline():
+                start = time.perf_counter()
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                path = target.split("?", 1)[0]
+                try:
+                    status, payload = await self.handle(method, path, body)
+                except Exception:
+                    log.exception("%s %s failed", method, path)
+                    status, payload = 500, {"error": "internal error, see the server log"}
+                seconds = time.perf_counter() - start
+                if path in ENDPOINTS:
+                    self.record(path, seconds)
+
+                content = json.dumps(payload).encode()
+                head = f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: application/json\r\nContent-Length: {len(content)}\r\nServer-Timing: total;dur={seconds * 1e3:.3f}\r\n\r\n"
+                writer.write(head.encode("latin-1") + content)
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    def close(self) -> None:
+        self.executor.shutdown(cancel_futures=True)
+
+
+async def serve(host: str = "127.0.0.1", port: int = 8750, unix_socket: str | None = None, max_workers: int | None = None, batch_window: float = 0.002, disk_cache: bool = False) -> None:
+    service = ScenarioService(max_workers=max_workers, batch_window=batch_window, disk_cache=disk_cache)
+    service.warm_up()
+    server = await asyncio.start_unix_server(service.serve_connection, path=unix_socket) if unix_socket else await asyncio.start_server(service.serve_connection, host, port)
+    print(f"serving on {unix_socket or f'http://{host}:{port}'} with {service.max_workers} workers", flush=True)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8750)
+    parser.add_argument("--unix", help="listen on this unix socket instead of tcp")
+    parser.add_argument("--workers", type=int, help="worker processes (default: cpu count)")
+    parser.add_argument("--batch-window", type=float, default=0.002, help="seconds to collect concurrent requests into one batch")
+    parser.add_argument("--disk-cache", action="store_true", help="also read and write the on-disk result cache")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, args.workers, args.batch_window, args.disk_cache))
+    except KeyboardInterrupt:
+        pass
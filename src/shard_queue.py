@@ -0,0 +1,275 @@
+"""
+multi-node scenario sweeps through a file-based work queue
+
+a coordinator splits the grid (incomes × prices × lump sums × products × start months) into deterministic shards, workers on any host sharing the queue directory claim shards with O_EXCL lock files, run them and write one parquet file per shard.
+the queue directory can live on local disk or on a network filesystem with atomic exclusive create (e.g. NFSv3+).
+
+    <queue>/plan.json                   grid and shard size
+    <queue>/claims/shard-<k>.<n>.lock   n-th claim of a shard, after `lease_seconds` without a result claim n+1 takes over
+    <queue>/results/shard-<k>.parquet   finished shard
+    <queue>/done/shard-<k>.json         who ran it and how long it took
+
+    python shard_queue.py plan /shared/queue --shard-size 200
+    python shard_queue.py work /shared/queue            # on every node, --local 4 starts 4 workers on this one
+    python shard_queue.py status /shared/queue
+    python shard_queue.py merge /shared/queue sweep.parquet
+"""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from math import prod
+from pathlib import Path
+from typing import NamedTuple
+
+import polars as pl
+
+from backtest import feasible_start_months
+from equity import Products
+from income import IncomePercentile
+from market_data import load_all, month_index
+from sweep import evaluate_range
+
+
+class QueueStatus(NamedTuple):
+    """
+    shard counts and per-worker throughput of a queue
+    """
+
+    shards: int
+    done: int
+    running: int
+    stale: int
+    todo: int
+    workers: pl.DataFrame
+
+
+def _shard_name(shard: int) -> str:
+    return f"shard-{shard:06d}"
+
+
+def _write_atomic(path: Path, content: str) -> None:
+    temporary = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    temporary.write_text(content)
+    os.replace(temporary, path)
+
+
+def plan(
+    queue_dir: Path | str,
+    incomes: list[IncomePercentile],
+    purchase_prices: list[float],
+    cash_savings: list[float],
+    products: list[Products],
+    start_months: list[tuple[int, int]],
+    years: int,
+    shard_size: int = 200,
+) -> int:
+    """
+    write the grid to `queue_dir` and return the number of shards
+
+    shard k holds scenarios k * shard_size onwards, in `itertools.product` order. planning the same grid again is a no-op, a different one is refused.
+    """
+    axes = {"incomes": [income.name for income in incomes], "purchase_prices": [float(price) for price in purchase_prices], "cash_savings": [float(cash) for cash in cash_savings], "products": [product.name for product in products], "start_months": [[year, month] for year, month in start_months]}
+    scenarios = prod(len(axis) for axis in axes.values())
+    assert scenarios > 0, "empty parameter grid"
+    assert years > 0
+    assert shard_size > 0
+
+    queue_dir = Path(queue_dir)
+    for directory in ("claims", "results", "done"):
+        (queue_dir / directory).mkdir(parents=True, exist_ok=True)
+    content = json.dumps({"axes": axes, "years": years, "shard_size": shard_size, "scenarios": scenarios, "shards": -(-scenarios // shard_size)}, indent=1)
+    if (queue_dir / "plan.json").exists():
+        assert (queue_dir / "plan.json").read_text() == content, f"{queue_dir} already holds a different plan, use a new directory"
+    else:
+        _write_atomic(queue_dir / "plan.json", content)
+    return json.loads(content)["shards"]
+
+
+def _load_plan(queue_dir: Path) -> dict:
+    assert (queue_dir / "plan.json").exists(), f"no plan in {queue_dir}, run `plan` first"
+    return json.loads((queue_dir / "plan.json").read_text())
+
+
+def _next_generation(queue_dir: Path, shard: int) -> int:
+    generation = 0
+    while (queue_dir / "claims" / f"{_shard_name(shard)}.{generation}.lock").exists():
+        generation += 1
+    return generation
+
+
+def _lease_left(queue_dir: Path, shard: int, lease_seconds: float) -> float:
+    # seconds until the latest claim of a shard expires, 0 for unclaimed or expired shards
+    generation = _next_generation(queue_dir, shard)
+    if generation == 0:
+        return 0.0
+    latest = queue_dir / "claims" / f"{_shard_name(shard)}.{generation - 1}.lock"
+    return max(latest.stat().st_mtime + lease_seconds - time.time(), 0.0)
+
+
+def _is_done(queue_dir: Path, shard: int) -> bool:
+    return (queue_dir / "done" / f"{_shard_name(shard)}.json").exists()
+
+
+def _claim(queue_dir: Path, shard: int, worker: str, lease_seconds: float) -> bool:
+    # every claim creates the next lock generation with O_EXCL, so exactly one worker wins each generation.
+    # an expired claim is taken over by creating the one after it, locks are never renamed or deleted
+    generation = _next_generation(queue_dir, shard)
+    if generation > 0 and (_lease_left(queue_dir, shard, lease_seconds) > 0 or _is_done(queue_dir, shard)):
+        return False
+
+    lock = queue_dir / "claims" / f"{_shard_name(shard)}.{generation}.lock"
+    try:
+        descriptor = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    with os.fdopen(descriptor, "w") as file:
+        file.write(json.dumps({"worker": worker, "claimed_at": time.time()}))
+    return True
+
+
+def _run_shard(queue_dir: Path, queue: dict, axes: tuple, shard: int, worker: str) -> None:
+    started_at = time.time()
+    start, stop = shard * queue["shard_size"], min((shard + 1) * queue["shard_size"], queue["scenarios"])
+    df = evaluate_range(axes, (start, stop))
+    assert df.height == stop - start
+
+    # result first, then the done record: a shard counts as done only once its parquet is complete
+    result = queue_dir / "results" / f"{_shard_name(shard)}.parquet"
+    temporary = result.with_name(f".{result.name}.{uuid.uuid4().hex}.tmp")
+    df.write_parquet(temporary)
+    os.replace(temporary, result)
+    _write_atomic(queue_dir / "done" / f"{_shard_name(shard)}.json", json.dumps({"worker": worker, "scenarios": df.height, "started_at": started_at, "finished_at": time.time()}))
+
+
+def work(queue_dir: Path | str, worker: str | None = None, lease_seconds: float = 900.0, max_shards: int | None = None, poll_seconds: float = 5.0) -> int:
+    """
+    claim and run shards until all are done, return the number of shards this worker ran
+
+    a shard must finish within `lease_seconds`, after that another worker may take it over (the result is the same either way).
+    while the remaining shards are claimed by others the worker checks every `poll_seconds` for finished or expired ones.
+    """
+    queue_dir = Path(queue_dir)
+    queue = _load_plan(queue_dir)
+    worker = worker or f"{socket.gethostname()}-{os.getpid()}"
+    assert lease_seconds > 0
+    assert max_shards is None or max_shards > 0
+    assert poll_seconds > 0
+
+    # the grid of `sweep` with a single horizon, so scenario positions match the plan
+    axes = ([IncomePercentile[name] for name in queue["axes"]["incomes"]], queue["axes"]["purchase_prices"], queue["axes"]["cash_savings"], [Products[name] for name in queue["axes"]["products"]], [tuple(start) for start in queue["axes"]["start_months"]], [queue["years"]])
+    load_all()
+    ran = 0
+    while left := [shard for shard in range(queue["shards"]) if not _is_done(queue_dir, shard)]:
+        # one pass over the unfinished shards, the next pass retakes those whose lease expired meanwhile
+        claimed = 0
+        for shard in left:
+            if max_shards is not None and ran >= max_shards:
+                return ran
+            if _claim(queue_dir, shard, worker, lease_seconds):
+                _run_shard(queue_dir, queue, axes, shard, worker)
+                ran += 1
+                claimed += 1
+        if claimed == 0:
+            # everything left runs elsewhere, wait for it to finish or for a lease to expire
+            time.sleep(min(poll_seconds, max(min(_lease_left(queue_dir, shard, lease_seconds) for shard in left), 0.01)))
+    return ran
+
+
+def work_local(queue_dir: Path | str, workers: int, lease_seconds: float = 900.0) -> None:
+    """
+    run `workers` separate worker processes on this machine, each standing in for a node
+    """
+    assert workers > 0
+    processes = [subprocess.Popen([sys.executable, __file__, "work", str(queue_dir), "--worker", f"{socket.gethostname()}-{k}", "--lease", str(lease_seconds)]) for k in range(workers)]
+    failed = [process.args for process in processes if process.wait() != 0]
+    assert not failed, f"workers failed: {failed}"
+
+
+def status(queue_dir: Path | str, lease_seconds: float = 900.0) -> QueueStatus:
+    """
+    shard counts and, per worker, shards, scenarios, busy seconds and scenarios per second
+    """
+    queue_dir = Path(queue_dir)
+    queue = _load_plan(queue_dir)
+
+    records = [json.loads(path.read_text()) for path in sorted((queue_dir / "done").glob("shard-*.json"))]
+    done = {path.stem for path in (queue_dir / "done").glob("shard-*.json")}
+    # the latest claim generation of every unfinished shard
+    latest: dict[str, tuple[int, Path]] = {}
+    for path in (queue_dir / "claims").glob("shard-*.*.lock"):
+        name, generation, _ = path.name.split(".")
+        if name not in done and int(generation) >= latest.get(name, (-1, path))[0]:
+            latest[name] = (int(generation), path)
+    claims = [path for _, path in latest.values()]
+    now = time.time()
+    stale = sum(now - path.stat().st_mtime > lease_seconds for path in claims)
+
+    workers = pl.DataFrame(records, schema={"worker": pl.String, "scenarios": pl.Int64, "started_at": pl.Float64, "finished_at": pl.Float64})
+    workers = workers.group_by("worker").agg(pl.len().alias("shards"), pl.col("scenarios").sum(), (pl.col("finished_at") - pl.col("started_at")).sum().alias("busy_seconds"), (pl.col("finished_at").max() - pl.col("started_at").min()).alias("wall_seconds")).with_columns((pl.col("scenarios") / pl.col("busy_seconds")).alias("scenarios_per_second")).sort("worker")
+    result = QueueStatus(shards=queue["shards"], done=len(done), running=len(claims) - stale, stale=stale, todo=queue["shards"] - len(done) - len(claims), workers=workers)
+    assert result.done + result.running + result.stale + result.todo == result.shards
+    return result
+
+
+def merge(queue_dir: Path | str, out: Path | str) -> Path:
+    """
+    concatenate all shards into one parquet file in scenario order, streaming so memory stays flat
+    """
+    queue_dir = Path(queue_dir)
+    queue = _load_plan(queue_dir)
+    results = [queue_dir / "results" / f"{_shard_name(shard)}.parquet" for shard in range(queue["shards"])]
+    missing = [path.name for path in results if not path.exists()]
+    assert not missing, f"{len(missing)} of {queue['shards']} shards not finished, e.g. {missing[0] if missing else ''}"
+
+    pl.scan_parquet(results).sink_parquet(out)
+    assert pl.scan_parquet(out).select(pl.len()).collect().item() == queue["scenarios"]
+    return Path(out)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    plan_parser = commands.add_parser("plan", help="split the grid into shards")
+    plan_parser.add_argument("queue", type=Path)
+    plan_parser.add_argument("--prices", type=float, nargs="+", default=[300_000, 400_000, 500_000, 600_000])
+    plan_parser.add_argument("--lump-sums", type=float, nargs="+", default=[80_000, 130_000, 200_000])
+    plan_parser.add_argument("--years", type=int, default=15)
+    plan_parser.add_argument("--shard-size", type=int, default=200)
+
+    work_parser = commands.add_parser("work", help="claim and run shards until none are left")
+    work_parser.add_argument("queue", type=Path)
+    work_parser.add_argument("--worker", help="worker name (default: host-pid)")
+    work_parser.add_argument("--local", type=int, help="start this many worker processes on this machine")
+    work_parser.add_argument("--lease", type=float, default=900.0, help="seconds before an unfinished claim may be taken over")
+
+    status_parser = commands.add_parser("status", help="progress and per-worker throughput")
+    status_parser.add_argument("queue", type=Path)
+    status_parser.add_argument("--lease", type=float, default=900.0)
+
+    merge_parser = commands.add_parser("merge", help="combine all shards into one parquet file")
+    merge_parser.add_argument("queue", type=Path)
+    merge_parser.add_argument("out", type=Path)
+    args = parser.parse_args()
+
+    if args.command == "plan":
+        # every start month with price data for at least one product, the others are recorded as errors
+        start_months = sorted({start for product in Products for start in feasible_start_months(args.years, product)}, key=lambda start: month_index(*start))
+        shards = plan(args.queue, list(IncomePercentile), args.prices, args.lump_sums, list(Products), start_months, args.years, args.shard_size)
+        print(f"planned {shards} shards in {args.queue}")
+    elif args.command == "work" and args.local:
+        work_local(args.queue, args.local, args.lease)
+    elif args.command == "work":
+        print(f"{args.worker or 'worker'}: ran {work(args.queue, args.worker, args.lease)} shards", file=sys.stderr)
+    elif args.command == "status":
+        queue_status = status(args.queue, args.lease)
+        print(f"{queue_status.done}/{queue_status.shards} shards done, {queue_status.running} running, {queue_status.stale} stale, {queue_status.todo} to do")
+        print(queue_status.workers)
+    else:
+        print(f"merged into {merge(args.queue, args.out)}")
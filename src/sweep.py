@@ -0,0 +1,190 @@
+import itertools
+import multiprocessing
+import os
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+from math import prod
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+
+from checkpoint import Checkpoint, run_checkpointed
+from equity import Products, simulate_equity_portfolio
+from income import IncomePercentile
+from market_data import load_all
+from real_estate import VariableRate, simulate_real_estate_portfolio
+from scenario_results import ScenarioResults
+
+SCHEMA = {
+    "income": pl.String,
+    "monthly_savings": pl.Float64,
+    "purchase_price": pl.Float64,
+    "cash_savings": pl.Float64,
+    "product": pl.String,
+    "start_year": pl.Int64,
+    "start_month": pl.Int64,
+    "years": pl.Int64,
+    "equity": pl.Float64,
+    "real_estate": pl.Float64,
+    "spread": pl.Float64,
+    "error": pl.String,
+}
+STRATEGIES = ("equity", "real_estate")
+
+
+def _evaluate(scenario: tuple[IncomePercentile, float, float, Products, int | tuple[int, int], int], variable_rate: VariableRate | None = None) -> tuple[dict, dict[str, np.ndarray]]:
+    # grid values and error of one scenario, and the monthly payouts of each strategy (none if infeasible). the start is a year (january) or a (year, month) pair
+    income, purchase_price, cash_savings, product, start, years = scenario
+    start_year, start_month = tuple(start) if isinstance(start, (tuple, list)) else (start, 1)
+    monthly_savings = income.value / 12  # same convention as main.run_comparison
+    row = {"income": income.name, "monthly_savings": monthly_savings, "purchase_price": float(purchase_price), "cash_savings": float(cash_savings), "product": product.name, "start_year": start_year, "start_month": start_month, "years": years}
+    assert purchase_price > 0
+    assert cash_savings >= 0
+    assert years > 0
+
+    # infeasible scenarios are part of the answer, record why instead of aborting the sweep
+    try:
+        equity = simulate_equity_portfolio(monthly_savings=monthly_savings, years=years, start_year=start_year, start_month=start_month, cash_savings=cash_savings, product=product)["payout"]
+        real_estate = simulate_real_estate_portfolio(monthly_savings=monthly_savings, years=years, start_year=start_year, start_month=start_month, purchase_price=purchase_price, cash_savings=cash_savings, variable_rate=variable_rate)["payout"]
+    except AssertionError as e:
+        failed_in = traceback.extract_tb(e.__traceback__)[-1].name
+        return row | {"error": f"{failed_in}: {e}" if str(e) else f"{failed_in}: assertion failed"}, {}
+
+    return row | {"error": None}, {"equity": equity.to_numpy(), "real_estate": real_estate.to_numpy()}
+
+
+def _evaluate_chunk(chunk: list[tuple[int, tuple]], months: int, keep_paths: bool = False, variable_rate: VariableRate | None = None) -> ScenarioResults:
+    # one store per chunk, payouts nan-padded to `months`. rows carry their grid position in `scenario`
+    assert len(chunk) > 0
+    rows = []
+    payouts = {strategy: np.full((len(chunk), months), np.nan) for strategy in STRATEGIES}
+    for k, (scenario_id, scenario) in enumerate(chunk):
+        row, paths = _evaluate(scenario, variable_rate)
+        rows.append({"scenario": scenario_id} | row)
+        for strategy, path in paths.items():
+            payouts[strategy][k, : len(path)] = path
+
+    results = ScenarioResults(months, keep_paths=keep_paths, strategies=STRATEGIES)
+    results.add(payouts, **{name: [row[name] for row in rows] for name in rows[0]})
+    assert len(results) == len(chunk)
+    return results
+
+
+def _frame(results: ScenarioResults) -> pl.DataFrame:
+    # one row per scenario in grid order, infeasible scenarios have null results
+    paths = [f"{strategy}_path" for strategy in STRATEGIES] if results.keep_paths else []
+    df = results.to_polars().sort("scenario").with_columns(pl.col(*STRATEGIES).fill_nan(None))
+    df = df.with_columns((pl.col("equity") - pl.col("real_estate")).alias("spread"))
+    return df.select(*(pl.col(name).cast(dtype) for name, dtype in ({"scenario": pl.Int64} | SCHEMA).items()), *paths)
+
+
+def run_sweep(
+    incomes: list[IncomePercentile],
+    purchase_prices: list[float],
+    cash_savings: list[float],
+    products: list[Products],
+    start_years: list[int],
+    years: list[int],
+    max_workers: int | None = None,
+    chunk_size: int | None = None,
+    progress: bool = True,
+    keep_paths: bool = False,
+    variable_rate: VariableRate | None = None,
+) -> pl.DataFrame:
+    """
+    evaluate both strategies for every combination of the given inputs
+
+    one row per scenario, in grid order. scenarios that violate a model constraint get a null result and an `error` reason.
+    `keep_paths` adds the monthly payouts as array columns `equity_path` and `real_estate_path`, nan after a scenario's horizon.
+    `variable_rate` finances every purchase with a variable rate mortgage from the scenario's start on, see `simulate_real_estate_portfolio`.
+    """
+    grid = list(itertools.product(incomes, purchase_prices, cash_savings, products, start_years, years))
+    assert len(grid) > 0, "empty parameter grid"
+    assert max_workers is None or max_workers > 0
+    assert chunk_size is None or chunk_size > 0
+
+    # parse the data once, forked workers then share the arrays copy-on-write
+    load_all()
+    max_workers = max_workers or os.cpu_count() or 1
+    chunk_size = chunk_size or max(1, len(grid) // (max_workers * 8))
+    scenarios = list(enumerate(grid))
+    chunks = [scenarios[i : i + chunk_size] for i in range(0, len(scenarios), chunk_size)]
+    months = max(years) * 12
+
+    # chunks arrive in completion order, `_frame` restores grid order
+    results = ScenarioResults(months, keep_paths=keep_paths, strategies=STRATEGIES)
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("fork")) as executor:
+        for future in as_completed([executor.submit(_evaluate_chunk, chunk, months, keep_paths, variable_rate) for chunk in chunks]):
+            results.extend(future.result())
+            if progress:
+                print(f"\rsweep: {len(results)}/{len(grid)} scenarios", end="", file=sys.stderr, flush=True)
+    if progress:
+        print(file=sys.stderr)
+
+    assert len(results) == len(grid)
+    return _frame(results).drop("scenario")
+
+
+def grid_chunk(axes: tuple[list, ...], start: int, stop: int) -> list[tuple[int, tuple]]:
+    """
+    (position, scenario) for scenarios start..stop of the grid in `itertools.product` order, without enumerating the ones before
+    """
+    assert 0 <= start < stop <= prod(len(axis) for axis in axes)
+    positions = np.unravel_index(np.arange(start, stop), [len(axis) for axis in axes])
+    return [(start + k, tuple(axis[position[k]] for axis, position in zip(axes, positions))) for k in range(stop - start)]
+
+
+def evaluate_range(axes: tuple[list, ...], bounds: tuple[int, int], variable_rate: VariableRate | None = None) -> pl.DataFrame:
+    """
+    rows of `run_sweep` for scenarios start..stop of the grid spanned by `axes`, with their grid position in `scenario`
+
+    `axes` are (incomes, purchase prices, cash savings, products, starts, years), a start is a year (january) or a (year, month) pair.
+    """
+    assert len(axes) == 6
+    return _frame(_evaluate_chunk(grid_chunk(axes, *bounds), max(axes[-1]) * 12, variable_rate=variable_rate))
+
+
+def run_sweep_checkpointed(
+    incomes: list[IncomePercentile],
+    purchase_prices: list[float],
+    cash_savings: list[float],
+    products: list[Products],
+    start_years: list[int],
+    years: list[int],
+    out_dir: Path | str,
+    max_workers: int | None = None,
+    chunk_size: int = 1_000,
+    progress: bool = True,
+    variable_rate: VariableRate | None = None,
+) -> pl.LazyFrame:
+    """
+    `run_sweep` for grids too large to hold or to finish in one go
+
+    every chunk of `chunk_size` scenarios is written to `out_dir` as soon as it finishes, rerunning with the same arguments resumes where the last run stopped.
+    rows carry their grid position in `scenario`, finished parts can be queried with `checkpoint.scan_results(out_dir)` while the sweep runs.
+    """
+    axes = (incomes, purchase_prices, cash_savings, products, start_years, years)
+    total = prod(len(axis) for axis in axes)
+    assert total > 0, "empty parameter grid"
+    assert chunk_size > 0
+
+    checkpoint = Checkpoint(out_dir, {"run": "sweep", "axes": axes, "chunk_size": chunk_size, "variable_rate": variable_rate})
+    n_chunks = -(-total // chunk_size)
+    units = ((chunk, (chunk * chunk_size, min((chunk + 1) * chunk_size, total))) for chunk in range(n_chunks))
+    return run_checkpointed(checkpoint, partial(evaluate_range, axes, variable_rate=variable_rate), units, n_chunks, max_workers, progress)
+
+
+if __name__ == "__main__":
+    df = run_sweep(
+        incomes=list(IncomePercentile),
+        purchase_prices=[300_000, 400_000, 500_000],
+        cash_savings=[80_000, 130_000],
+        products=list(Products),
+        start_years=[2004, 2008],
+        years=[15],
+    )
+    print(df)
+    print(df.group_by("error").len())